@@ -1,10 +1,17 @@
 import time
 import asyncio
+from operator import itemgetter
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, HTTPException, BackgroundTasks
-from ...models.schemas import AnalysisRequest, ProblemAnalysisRequest
-from ...services.openai_service import analyze_text, analyze_post_with_comments
-from ...services.search_service import analyze_problem_posts
+from fastapi.responses import StreamingResponse
+from ...models.schemas import AnalysisRequest, ProblemAnalysisRequest, BatchAnalysisRequest
+from ...services.openai_service import analyze_text, stream_text_analysis, analyze_post_with_comments
+from ...services.search_service import (
+    analyze_problem_posts,
+    submit_subreddit_analysis_batch,
+    collect_analysis_batch
+)
 from ...services.supabase_service import (
     get_last_search,
     get_analyzed_posts,
@@ -13,10 +20,34 @@ from ...services.supabase_service import (
 )
 from ...config import supabase  # Add this import for supabase client
 from ...utils.task_manager import task_manager
+from ...utils.constants import TIMEFRAME_DELTAS, ANALYZE_PROBLEMS_TTL_SECONDS
 from ...utils.logging import print_step, print_success, print_error
 
 router = APIRouter()
 
+# Single-flight registry for /analyze-problems: (subreddit, timeframe, min_score) ->
+# (task_id, expires_at). Running tasks never expire; finished ones are reused for a short TTL.
+_inflight: Dict[Tuple[str, str, int], Tuple[str, float]] = {}
+# Number of callers sharing each coalesced task; a stop request only cancels the task
+# once every caller sharing it has asked to stop
+_subscribers: Dict[str, int] = {}
+
+def _is_reusable(task_id: str, expires_at: float) -> bool:
+    task = task_manager.active_tasks.get(task_id)
+    return not (task is None or task.cancelled() or (
+        task.done() and (task.exception() or time.monotonic() > expires_at)
+    ))
+
+def _coalesced_task_id(key: Tuple[str, str, int]) -> Optional[str]:
+    """Return the task already serving this request, if it is running or recently succeeded."""
+    # Drop every stale entry, not just this key's, so the registry doesn't grow with each new key
+    for stale_key, (task_id, expires_at) in list(_inflight.items()):
+        if not _is_reusable(task_id, expires_at):
+            del _inflight[stale_key]
+            _subscribers.pop(task_id, None)
+    entry = _inflight.get(key)
+    return entry[0] if entry else None
+
 @router.post("/analyze")
 async def analyze(request: AnalysisRequest):
     try:
@@ -25,12 +56,19 @@ async def analyze(request: AnalysisRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/analyze/stream")
+async def analyze_stream(request: AnalysisRequest):
+    """Analyze text, streaming the analysis back as it is generated."""
+    return StreamingResponse(stream_text_analysis(request.text), media_type="text/plain")
+
 @router.post("/analyze-with-comments")
 async def analyze_with_comments(post_id: str, comment_limit: int = 5):
     """Analyze a post together with its top comments."""
     try:
         # First get the post from database
-        post = supabase.table("reddit_posts").select("*").eq("id", post_id).execute()
+        post = await asyncio.to_thread(
+            supabase.table("reddit_posts").select("id, title, selftext").eq("id", post_id).limit(1).execute
+        )
         if not post.data:
             raise HTTPException(status_code=404, detail="Post not found")
         
@@ -44,9 +82,51 @@ async def analyze_with_comments(post_id: str, comment_limit: int = 5):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/analyze-batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """Queue analyses of a subreddit's unanalyzed posts on the OpenAI Batch API.
+
+    Batches are cheaper and not bound by the synchronous rate limits, but may take up to 24 hours;
+    poll /analyze-batch/{batch_id} to store the results.
+    """
+    batch_id, post_count = await submit_subreddit_analysis_batch(request.subreddit, request.limit)
+    if not post_count:
+        return {"status": "empty", "batch_id": None, "post_count": 0}
+    if not batch_id:
+        raise HTTPException(status_code=500, detail="Failed to submit analysis batch")
+    return {"status": "submitted", "batch_id": batch_id, "post_count": post_count}
+
+@router.get("/analyze-batch/{batch_id}")
+async def get_analysis_batch(batch_id: str):
+    """Check an analysis batch, storing its analyses once it has completed."""
+    try:
+        status, stored = await collect_analysis_batch(batch_id)
+        return {"status": status, "stored": stored}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/analyze-problems")
 async def analyze_problems(request: ProblemAnalysisRequest, background_tasks: BackgroundTasks):
     """Analyze problem-related posts in a subreddit."""
+    # Identical requests share one running (or just finished) task instead of
+    # repeating the Reddit fetch and LLM analyses
+    key = (request.subreddit.lower(), request.timeframe, request.min_score)
+    existing_task_id = _coalesced_task_id(key)
+    if existing_task_id:
+        print_step(f"Reusing search task {existing_task_id} for identical request")
+        if task_manager.active_tasks[existing_task_id].done():
+            return {
+                "status": "success",
+                "task_id": existing_task_id,
+                "message": "Search already completed"
+            }
+        _subscribers[existing_task_id] = _subscribers.get(existing_task_id, 1) + 1
+        return {
+            "status": "success",
+            "task_id": existing_task_id,
+            "message": "Search already in progress"
+        }
+    
     # Generate a unique task ID
     task_id = str(int(time.time() * 1000))  # millisecond timestamp as ID
     print_step(f"Creating new search task with ID: {task_id}")
@@ -56,17 +136,12 @@ async def analyze_problems(request: ProblemAnalysisRequest, background_tasks: Ba
     
     async def search_task():
         try:
-            if request.timeframe not in ['week', 'month', 'year']:
+            if request.timeframe not in TIMEFRAME_DELTAS:
                 raise HTTPException(status_code=400, detail="Invalid timeframe")
             
             # Calculate the time range
             now = datetime.now(timezone.utc)
-            if request.timeframe == 'week':
-                start_time = now - timedelta(days=7)
-            elif request.timeframe == 'month':
-                start_time = now - timedelta(days=30)
-            else:  # year
-                start_time = now - timedelta(days=365)
+            start_time = now - TIMEFRAME_DELTAS[request.timeframe]
             
             # Check if we have a recent search
             last_search = await get_last_search(request.subreddit, request.timeframe)
@@ -74,40 +149,17 @@ async def analyze_problems(request: ProblemAnalysisRequest, background_tasks: Ba
             needs_new_search = True
             
             if last_search:
-                try:
-                    # Get the timestamp strings from the search history
-                    last_search_time_str = last_search['last_search_time']
-                    last_post_time_str = last_search['last_post_time']
-                    
-                    # Parse PostgreSQL ISO 8601 timestamps
-                    # Format: YYYY-MM-DD"T"HH24:MI:SS.MSOF
-                    def parse_timestamp(ts_str: str) -> datetime:
-                        try:
-                            # Try parsing with milliseconds
-                            dt = datetime.strptime(ts_str, '%Y-%m-%dT%H:%M:%S.%f+00:00')
-                        except ValueError:
-                            # Try without milliseconds
-                            dt = datetime.strptime(ts_str, '%Y-%m-%dT%H:%M:%S+00:00')
-                        return dt.replace(tzinfo=timezone.utc)
-                    
-                    last_search_time = parse_timestamp(last_search_time_str)
-                    last_post_time = parse_timestamp(last_post_time_str)
-                    
-                    # Check if cache is fresh (less than 24 hours old)
-                    if now - last_search_time < timedelta(hours=24):
-                        needs_new_search = False
-                        print_step("Last search was recent, using cached results")
-                    
-                except (ValueError, KeyError) as e:
-                    print_error(f"Error parsing timestamps: {str(e)}")
-                    # Explicitly invalidate cache on timestamp parsing error
-                    last_search_time = now
-                    last_post_time = now
-                    needs_new_search = True
+                # last_search_time is a timestamptz, so asyncpg returns an aware datetime
+                last_search_time = last_search['last_search_time']
+                
+                # Check if cache is fresh (less than 24 hours old)
+                if now - last_search_time < timedelta(hours=24):
+                    needs_new_search = False
+                    print_step("Last search was recent, using cached results")
                 
                 # Get existing analyzed posts regardless of cache freshness
                 print_step("Checking for existing analyzed posts...")
-                existing_posts = await get_analyzed_posts(request.subreddit, start_time)
+                existing_posts = await get_analyzed_posts(request.subreddit, start_time, request.min_score)
                 if existing_posts:
                     print_success(f"Found {len(existing_posts)} existing analyzed posts")
                 else:
@@ -117,20 +169,21 @@ async def analyze_problems(request: ProblemAnalysisRequest, background_tasks: Ba
             if needs_new_search:
                 print_step(f"Searching for new problem-related posts in r/{request.subreddit}...")
                 try:
+                    # Only analyze posts that aren't already in the cached results
+                    existing_ids = {post['id'] for post in existing_posts}
                     new_posts = await analyze_problem_posts(
                         request.subreddit, 
                         request.timeframe,
-                        request.min_score
+                        request.min_score,
+                        exclude_ids=existing_ids
                     )
                     
                     # Always update search history after a new search
                     newest_post_time = now
                     if new_posts:
                         # If we found posts, use the newest post time
-                        newest_post_time = max(
-                            datetime.fromtimestamp(post.get('created_utc', 0), tz=timezone.utc)
-                            for post in new_posts
-                        )
+                        newest_ts = max(post.get('created_utc', 0) for post in new_posts)
+                        newest_post_time = datetime.fromtimestamp(newest_ts, tz=timezone.utc)
                         print_success(f"Found and analyzed {len(new_posts)} new problem-related posts")
                     else:
                         print_step("No new problem-related posts found")
@@ -144,11 +197,10 @@ async def analyze_problems(request: ProblemAnalysisRequest, background_tasks: Ba
                     pass
 
             # Combine and sort all posts by score
-            all_posts = sorted(
-                existing_posts + new_posts, 
-                key=lambda x: x.get('score', 0), 
-                reverse=True
-            )
+            all_posts = existing_posts + new_posts
+            for post in all_posts:
+                post.setdefault('score', 0)
+            all_posts.sort(key=itemgetter('score'), reverse=True)
             
             if not all_posts:
                 print_step("No posts found (neither in cache nor from new search)")
@@ -178,6 +230,14 @@ async def analyze_problems(request: ProblemAnalysisRequest, background_tasks: Ba
     # Create and store the task
     task = asyncio.create_task(search_task())
     task_manager.register_task(task_id, task)
+    _inflight[key] = (task_id, float('inf'))
+    _subscribers[task_id] = 1
+    
+    def expire_when_done(_):
+        if _inflight.get(key, (None,))[0] == task_id:
+            _inflight[key] = (task_id, time.monotonic() + ANALYZE_PROBLEMS_TTL_SECONDS)
+    
+    task.add_done_callback(expire_when_done)
     print_success(f"Task {task_id} created and stored")
     
     return {
@@ -228,5 +288,13 @@ async def stop_search(task_id: str):
     if not task_info:
         raise HTTPException(status_code=404, detail="Search task not found")
     
+    # Identical requests share one task; keep it running while other callers still wait on it
+    remaining = _subscribers.get(task_id, 1) - 1
+    if remaining > 0:
+        _subscribers[task_id] = remaining
+        print_step(f"Task {task_id} is still shared by {remaining} other request(s), not cancelling")
+        return {"status": "detached", "task_id": task_id}
+    _subscribers.pop(task_id, None)
+    
     await task_manager.cancel_task(task_id)
     return {"status": "cancelled", "task_id": task_id} 
\ No newline at end of file
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from ...models.schemas import SearchRequest, SmartAnalysisRequest
 from ...services.search_service import smart_analysis_pipeline
-from ...utils.logging import print_step, print_success, print_error
+from ...utils.logging import print_success, print_error
 
 router = APIRouter()
 
@@ -37,7 +37,8 @@ async def smart_analysis(request: SmartAnalysisRequest):
             min_similarity=request.min_similarity,
             max_posts=request.max_posts,
             analyze_count=request.analyze_count,
-            comment_limit=request.comment_limit
+            comment_limit=request.comment_limit,
+            ef_search=request.ef_search
         )
         return {"status": "success", "data": results}
     except Exception as e:
@@ -1,16 +1,15 @@
 from fastapi import APIRouter, HTTPException, Query
 from ...models.schemas import BatchProcessRequest, SubredditValidationResponse
 from ...services.reddit import validate_subreddit, fetch_posts_async
-from ...services.search_service import fetch_and_filter_posts
-from ...config import supabase
-from ...utils.logging import print_step, print_success, print_error
+from ...services.search_service import process_subreddits
+from ... import db
 
 router = APIRouter()
 
 @router.get("/validate/{subreddit}")
 async def validate_subreddit_endpoint(subreddit: str) -> SubredditValidationResponse:
     """Validate if a subreddit exists and is accessible."""
-    is_valid = validate_subreddit(subreddit)
+    is_valid = await validate_subreddit(subreddit)
     message = f"r/{subreddit} is valid" if is_valid else f"r/{subreddit} is invalid or inaccessible"
     return SubredditValidationResponse(is_valid=is_valid, message=message)
 
@@ -29,27 +28,41 @@ async def get_subreddit_posts(
 async def batch_process(request: BatchProcessRequest):
     """Process multiple subreddits and store posts with embeddings."""
     try:
-        results = await fetch_and_filter_posts(
+        # Validate and process every subreddit concurrently, skipping the invalid ones
+        results = await process_subreddits(
             subreddits=request.subreddits,
-            post_limit=request.post_limit
-        )
-        return {"status": "success", "processed_count": results}
+            post_limit=request.post_limit,
+            validate=True
+        ) if request.subreddits else {}
+        processed = sum(count for count in results.values() if count is not None)
+        skipped = [subreddit for subreddit, count in results.items() if count is None]
+        return {"status": "success", "processed_count": processed, "skipped_subreddits": skipped}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{subreddit}/stats")
-async def get_subreddit_stats(subreddit: str):
-    """Get statistics about stored posts for a subreddit."""
+async def get_subreddit_stats(subreddit: str, exact: bool = False):
+    """Get statistics about stored posts for a subreddit.
+    
+    Counts come from the subreddit_stats view, refreshed every few minutes;
+    pass exact=true to count the posts directly.
+    """
     try:
-        stats = supabase.table("reddit_posts")\
-            .select("*", count="exact")\
-            .eq("subreddit", subreddit)\
-            .execute()
+        if exact:
+            stats = await db.fetchrow(
+                "SELECT count(*) AS total_posts FROM reddit_posts WHERE subreddit = $1",
+                subreddit
+            )
+        else:
+            stats = await db.fetchrow(
+                "SELECT total_posts FROM subreddit_stats WHERE subreddit = $1",
+                subreddit
+            )
         
         return {
             "status": "success",
             "stats": {
-                "total_posts": stats.count,
+                "total_posts": stats['total_posts'] if stats else 0,
                 "subreddit": subreddit
             }
         }
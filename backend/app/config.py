@@ -1,7 +1,8 @@
 import os
+import httpx
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
-from supabase import create_client, Client
+from supabase import create_client
 from .utils.logging import print_step, print_success, print_error
 import sys
 
@@ -11,26 +12,50 @@ load_dotenv()
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Chat model for post analyses; also part of the analysis cache key
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+# Input token cap for analysis prompts; longer post and comment text is truncated
+MAX_INPUT_TOKENS = int(os.getenv('MAX_INPUT_TOKENS', '2000'))
 
 # Reddit API Configuration
 REDDIT_CLIENT_ID = os.getenv('REDDIT_CLIENT_ID')
 REDDIT_CLIENT_SECRET = os.getenv('REDDIT_CLIENT_SECRET')
 REDDIT_USER_AGENT = 'MarketResearchBot/1.0'
 
+# On-disk embedding cache, so embeddings survive restarts
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'emb_cache.db')
+
 # Supabase Configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+# Direct Postgres connection string, used for queries through the asyncpg pool
+SUPABASE_DB_URL = os.getenv('SUPABASE_DB_URL')
 
 # Initialize Supabase client
 try:
     print_step("Initializing Supabase client...")
     supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
     
+    # Share one HTTP/2 keep-alive pool across all PostgREST calls so parallel
+    # queries are multiplexed instead of each paying a new TLS handshake
+    postgrest = supabase.postgrest
+    postgrest.session = httpx.Client(
+        base_url=postgrest.session.base_url,
+        headers=postgrest.session.headers,
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=50,
+            max_connections=100,
+            keepalive_expiry=60
+        ),
+        timeout=30.0
+    )
+    
     # Test the connection
     print_step("Testing Supabase connection...")
     test = supabase.table("reddit_posts").select("id").limit(1).execute()
     print_success("Successfully connected to Supabase")
 except Exception as e:
     print_error(f"Failed to initialize Supabase: {str(e)}")
-    print(f"Please check your Supabase credentials and connection.")
+    print("Please check your Supabase credentials and connection.")
     sys.exit(1)  # Exit if we can't connect to Supabase 
\ No newline at end of file
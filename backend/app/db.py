@@ -0,0 +1,49 @@
+import asyncpg
+from typing import List, Dict, Optional, Sequence
+from .config import SUPABASE_DB_URL
+from .utils.logging import print_step, print_success
+
+# Shared asyncpg connection pool, created on application startup
+pool: Optional[asyncpg.Pool] = None
+
+async def init_pool() -> None:
+    """Create the shared connection pool."""
+    global pool
+    print_step("Creating database connection pool...")
+    pool = await asyncpg.create_pool(
+        SUPABASE_DB_URL,
+        min_size=5,
+        max_size=20,
+        # Supabase's pooler runs in transaction mode, which can't keep prepared statements
+        statement_cache_size=0
+    )
+    print_success("Database connection pool ready")
+
+async def close_pool() -> None:
+    """Close the shared connection pool."""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+async def fetch(query: str, *args) -> List[Dict]:
+    """Run a query and return all rows as dicts."""
+    rows = await pool.fetch(query, *args)
+    return [dict(row) for row in rows]
+
+async def fetchrow(query: str, *args) -> Optional[Dict]:
+    """Run a query and return the first row as a dict, or None."""
+    row = await pool.fetchrow(query, *args)
+    return dict(row) if row else None
+
+async def execute(query: str, *args) -> str:
+    """Run a statement and return its status string."""
+    return await pool.execute(query, *args)
+
+def acquire():
+    """Acquire a pooled connection, for work that needs one connection such as COPY in a transaction."""
+    return pool.acquire()
+
+def vector_literal(embedding: Sequence[float]) -> str:
+    """Format an embedding as a pgvector literal, for use with a ::vector cast."""
+    return "[" + ",".join(map(str, embedding)) + "]"
@@ -2,7 +2,11 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from .api.routes import search, analysis, subreddit
-from .utils.logging import print_banner, print_step, print_success
+from . import db
+from .services.reddit import close_sessions
+from .services.flat_index import flat_index
+from .services.openai_service import load_tokenizer
+from .utils.logging import print_banner, print_step
 
 # Initialize FastAPI app
 app = FastAPI(title="Guliver API", version="1.0.0")
@@ -16,6 +20,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    await db.init_pool()
+    await flat_index.load()
+    await load_tokenizer()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await db.close_pool()
+    await close_sessions()
+
 # Include routers
 app.include_router(search.router, prefix="/api", tags=["search"])
 app.include_router(analysis.router, prefix="/api", tags=["analysis"])
@@ -0,0 +1,58 @@
+import msgspec
+from typing import List, Dict, Optional
+
+class RedditPost(msgspec.Struct):
+    """The subset of Reddit post fields used by Guliver."""
+    id: str
+    title: str
+    created_utc: float
+    selftext: Optional[str] = None
+    url: Optional[str] = None
+    score: int = 0
+    subreddit: str = ""
+
+class RedditChild(msgspec.Struct):
+    data: RedditPost
+
+class RedditChildren(msgspec.Struct):
+    children: List[RedditChild]
+
+class RedditListing(msgspec.Struct):
+    data: RedditChildren
+
+_listing_decoder = msgspec.json.Decoder(RedditListing)
+
+def decode_listing(raw: bytes) -> List[Dict]:
+    """Decode a Reddit listing response body into post dicts with only the used fields."""
+    listing = _listing_decoder.decode(raw)
+    posts = []
+    for child in listing.data.children:
+        post = msgspec.structs.asdict(child.data)
+        # Reddit sends null for some of these, so one such post doesn't reject the whole listing
+        post['selftext'] = post['selftext'] or ""
+        post['url'] = post['url'] or ""
+        posts.append(post)
+    return posts
+
+class RedditComment(msgspec.Struct):
+    body: str = ""
+
+class RedditCommentChild(msgspec.Struct):
+    kind: str
+    data: RedditComment
+
+class RedditCommentChildren(msgspec.Struct):
+    children: List[RedditCommentChild]
+
+class RedditCommentListing(msgspec.Struct):
+    data: RedditCommentChildren
+
+# The comments endpoint returns [post_listing, comments_listing]
+_comments_decoder = msgspec.json.Decoder(List[RedditCommentListing])
+
+def decode_comments(raw: bytes) -> List[str]:
+    """Decode a Reddit comments response body into the bodies of its top-level comments."""
+    listings = _comments_decoder.decode(raw)
+    if len(listings) < 2:
+        return []
+    return [child.data.body for child in listings[1].data.children if child.kind == 't1']
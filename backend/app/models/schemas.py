@@ -22,6 +22,7 @@ class SmartAnalysisRequest(BaseModel):
     max_posts: int = 5
     analyze_count: Optional[int] = None
     comment_limit: int = 5
+    ef_search: int = 80  # HNSW search breadth; higher is slower but more accurate
 
 class SubredditValidationResponse(BaseModel):
     is_valid: bool
@@ -32,6 +33,10 @@ class ProblemAnalysisRequest(BaseModel):
     timeframe: str = 'week'  # 'week', 'month', or 'year'
     min_score: int = 5  # Minimum score threshold
 
+class BatchAnalysisRequest(BaseModel):
+    subreddit: str
+    limit: int = 500  # Maximum number of unanalyzed posts to submit
+
 class SearchHistory(BaseModel):
     subreddit: str
     timeframe: str
@@ -0,0 +1,172 @@
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from .. import db
+from ..utils.logging import print_step, print_success, print_error
+from ..utils.constants import FLAT_SEARCH_MAX_ROWS, EMBEDDING_DIMENSIONS
+
+# Rows pulled per query while loading, so the whole table is never held as Python floats at once
+_LOAD_CHUNK_SIZE = 5000
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def _quantize_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize float rows to int8 with a per-row scale, so row ~= quantized * scale."""
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1
+    quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+def quantize_embedding(embedding: List[float]) -> Tuple[bytes, float]:
+    """Quantize a unit-normalized embedding to int8 bytes plus its scale, for the embedding_i8 column."""
+    quantized, scales = _quantize_rows(_normalize(np.array([embedding], dtype=np.float32)))
+    return quantized[0].tobytes(), float(scales[0])
+
+class FlatIndex:
+    """Exhaustive in-memory cosine search over all stored post embeddings, held as int8.
+
+    Pre-ranks candidates instead of the match_posts RPC while reddit_posts is small enough to keep in memory.
+    """
+
+    def __init__(self):
+        self._clear()
+
+    def _clear(self) -> None:
+        self.enabled = False
+        self.ids = np.empty(0, dtype=object)
+        self.subreddits = np.empty(0, dtype=object)
+        self.matrix = np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.int8)
+        self.scales = np.empty(0, dtype=np.float32)
+        self.positions: Dict[str, int] = {}
+
+    async def load(self) -> None:
+        """Load every stored embedding, unless the table is too large for a flat search."""
+        self._clear()
+        try:
+            row = await db.fetchrow("SELECT count(*) AS total FROM reddit_posts")
+            if row['total'] > FLAT_SEARCH_MAX_ROWS:
+                print_step(f"{row['total']} posts stored, using the vector index for search")
+                return
+
+            print_step(f"Loading {row['total']} embeddings for in-memory search...")
+            ids, subreddits, chunks, scale_chunks = [], [], [], []
+            last_id = ""
+            while True:
+                # Rows written with an int8 copy are read as ~1.5 KB bytea instead of a 6 KB float array
+                rows = await db.fetch(
+                    """SELECT id, lower(subreddit) AS subreddit, embedding_i8, embedding_scale,
+                        CASE WHEN embedding_i8 IS NULL THEN embedding::real[] END AS embedding
+                    FROM reddit_posts
+                    WHERE id > $1 AND embedding IS NOT NULL
+                    ORDER BY id LIMIT $2""",
+                    last_id, _LOAD_CHUNK_SIZE
+                )
+                if not rows:
+                    break
+                ids.extend(row['id'] for row in rows)
+                subreddits.extend(row['subreddit'] for row in rows)
+                chunk, scales = self._quantized_chunk(rows)
+                chunks.append(chunk)
+                scale_chunks.append(scales)
+                last_id = rows[-1]['id']
+
+            self.ids = np.array(ids, dtype=object)
+            self.subreddits = np.array(subreddits, dtype=object)
+            if chunks:
+                self.matrix = np.vstack(chunks)
+                self.scales = np.concatenate(scale_chunks)
+            self.positions = {post_id: i for i, post_id in enumerate(ids)}
+            self.enabled = True
+            print_success(f"In-memory search ready over {len(ids)} posts")
+        except Exception as e:
+            print_error(f"Error loading embeddings for in-memory search: {e}")
+            self.enabled = False
+
+    @staticmethod
+    def _quantized_chunk(rows: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Stack a chunk of loaded rows as int8, quantizing rows that only have a float embedding."""
+        matrix = np.empty((len(rows), EMBEDDING_DIMENSIONS), dtype=np.int8)
+        scales = np.empty(len(rows), dtype=np.float32)
+        float_rows = [i for i, row in enumerate(rows) if row['embedding_i8'] is None]
+        for i, row in enumerate(rows):
+            if row['embedding_i8'] is not None:
+                matrix[i] = np.frombuffer(row['embedding_i8'], dtype=np.int8)
+                scales[i] = row['embedding_scale']
+        if float_rows:
+            floats = _normalize(np.array([rows[i]['embedding'] for i in float_rows], dtype=np.float32))
+            matrix[float_rows], scales[float_rows] = _quantize_rows(floats)
+        return matrix, scales
+
+    def add(self, posts: List[dict], embeddings: List[List[float]]) -> None:
+        """Insert or replace stored posts so searches see them without a reload."""
+        if not self.enabled:
+            return
+
+        new_ids, new_subreddits, new_rows = [], [], []
+        for post, embedding in zip(posts, embeddings):
+            if not embedding:
+                continue
+            vector = _normalize(np.array([embedding], dtype=np.float32))[0]
+            subreddit = (post.get('subreddit') or '').lower()
+            position = self.positions.get(post['id'])
+            if position is not None:
+                quantized, scales = _quantize_rows(vector[None, :])
+                self.matrix[position] = quantized[0]
+                self.scales[position] = scales[0]
+                self.subreddits[position] = subreddit
+            elif post['id'] not in new_ids:
+                new_ids.append(post['id'])
+                new_subreddits.append(subreddit)
+                new_rows.append(vector)
+
+        if not new_ids:
+            return
+        if len(self.ids) + len(new_ids) > FLAT_SEARCH_MAX_ROWS:
+            # Outgrown a flat search: free the memory and let the RPC path take over
+            print_step("Stored posts exceed the in-memory search limit, switching to the vector index")
+            self._clear()
+            return
+
+        start = len(self.ids)
+        self.positions.update({post_id: start + i for i, post_id in enumerate(new_ids)})
+        self.ids = np.concatenate([self.ids, np.array(new_ids, dtype=object)])
+        self.subreddits = np.concatenate([self.subreddits, np.array(new_subreddits, dtype=object)])
+        quantized, scales = _quantize_rows(np.array(new_rows, dtype=np.float32))
+        self.matrix = np.vstack([self.matrix, quantized])
+        self.scales = np.concatenate([self.scales, scales])
+
+    def search(
+        self,
+        query_embedding: List[float],
+        match_threshold: float,
+        limit: int,
+        subreddit: Optional[str] = None,
+        cursor: Optional[Tuple[float, str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Return (post_id, similarity) pairs ordered like match_posts: similarity desc, id desc."""
+        if not len(self.ids):
+            return []
+
+        query, query_scale = _quantize_rows(_normalize(np.array([query_embedding], dtype=np.float32)))
+        # int8 dot products accumulated in int32, then rescaled back to cosine similarity
+        dots = np.einsum('nd,d->n', self.matrix, query[0], dtype=np.int32)
+        scores = dots * self.scales * query_scale[0]
+
+        mask = scores > match_threshold
+        if subreddit:
+            mask &= self.subreddits == subreddit.lower()
+        if cursor:
+            cursor_similarity, cursor_id = cursor
+            mask &= (scores < cursor_similarity) | ((scores == cursor_similarity) & (self.ids < cursor_id))
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+
+        ranked = sorted(candidates, key=lambda i: (scores[i], self.ids[i]), reverse=True)
+        return [(self.ids[i], float(scores[i])) for i in ranked]
+
+# Shared index instance, loaded on application startup
+flat_index = FlatIndex()
@@ -1,15 +1,35 @@
-from typing import List, Optional
-from ..config import openai_client
-from ..utils.logging import print_step, print_success, print_error
+import asyncio
+import hashlib
+import json
+import sqlite3
+import numpy as np
+import tiktoken
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from openai import APIError, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from ..config import openai_client, EMBEDDING_CACHE_PATH, OPENAI_MODEL, MAX_INPUT_TOKENS
+from ..utils.logging import print_debug, print_success, print_error
+from ..utils.rate_limiter import RateLimiter
+from ..utils.constants import (
+    EMBEDDING_CACHE_SIZE,
+    ANALYSIS_CACHE_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MODEL,
+    ANALYSIS_CONCURRENCY,
+    ANALYSIS_MAX_TOKENS,
+    ANALYSIS_MODEL_LARGE,
+    ANALYSIS_ESCALATION_CHARS,
+    ANALYSIS_BATCH_INPUT_TOKENS,
+    OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT
+)
+from .supabase_service import get_cached_analysis, store_cached_analysis
 
-async def analyze_text(text: str) -> str:
-    """Analyze text using AI to extract market problems or startup ideas."""
-    print_step("Analyzing post")
-    try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {"role": "system", "content": """You are an expert market research analyst and startup advisor. 
+# System messages are built once and sent byte-identical on every call, so repeated requests
+# share a prompt prefix
+_TEXT_ANALYSIS_SYSTEM_MSG = {"role": "system", "content": """You are an expert market research analyst and startup advisor. 
 Your task is to analyze both the post and its comments to determine whether they present problems or opportunities for startups. Analyze all discussions to identify:
 1. Clear market opportunities and gaps
 2. Specific user pain points and problems
@@ -17,55 +37,337 @@ Your task is to analyze both the post and its comments to determine whether they
 4. Market size indicators and trends
 5. Competitive landscape insights
 
-Pay special attention to user comments as they often provide validation of problems and additional context. Be precise, practical, and focus on actionable insights."""},
-                {"role": "user", "content": f"Analyze this Reddit post and its comments to extract valuable market insights:\n\n{text}"}
+Pay special attention to user comments as they often provide validation of problems and additional context. Be precise, practical, and focus on actionable insights."""}
+
+_POST_ANALYSIS_SYSTEM_MSG = {"role": "system", "content": """You are an expert market research analyst and startup advisor. 
+Analyze both the main post and its comments to identify:
+1. Clear market opportunities and gaps
+2. Specific user pain points and problems
+3. Potential startup ideas or business solutions
+4. Market size indicators and trends
+5. Competitive landscape insights
+6. Additional insights from comment discussions
+
+Focus on actionable insights and note when comments provide additional context or validation to the main post's points."""}
+
+_BATCH_ANALYSIS_SYSTEM_MSG = {"role": "system", "content": """You are an expert market research analyst and startup advisor. 
+Your task is to analyze multiple posts and their comments to determine whether they present problems or opportunities for startups.
+For each post, provide a separate analysis that identifies:
+1. Clear market opportunities and gaps
+2. Specific user pain points and problems
+3. Potential startup ideas or business solutions
+4. Market size indicators and trends
+5. Competitive landscape insights
+
+Respond with a JSON object mapping each post id to its analysis as a string, e.g. {"abc123": "<analysis>"}.
+Be precise, practical, and focus on actionable insights."""}
+
+# In-process LRU of text hash -> embedding, so repeated texts skip the API call
+_embedding_cache: "OrderedDict[bytes, List[float]]" = OrderedDict()
+
+def _embedding_key(text: str) -> bytes:
+    return hashlib.blake2b(f"{EMBEDDING_MODEL}\n{text}".encode(), digest_size=16).digest()
+
+def _get_cached_embedding(key: bytes) -> Optional[List[float]]:
+    cached = _embedding_cache.get(key)
+    if cached is not None:
+        _embedding_cache.move_to_end(key)
+    return cached
+
+def _cache_embedding(key: bytes, embedding: List[float]) -> None:
+    _embedding_cache[key] = embedding
+    _embedding_cache.move_to_end(key)
+    if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+
+# In-process LRU of (prompt, model, content) hash -> analysis, so identical texts within a run
+# skip the model call and the stored-analysis lookup
+_analysis_cache: "OrderedDict[str, str]" = OrderedDict()
+# Post analyses in flight by the same key, so concurrent duplicates share one request
+_analysis_inflight: Dict[str, "asyncio.Task[str]"] = {}
+# Callers waiting on each in-flight analysis; the analysis is cancelled when all of them are
+_analysis_waiters: Dict[str, int] = {}
+
+def _analysis_key(prompt: str, model: str, content: str) -> str:
+    return hashlib.blake2b(f"{prompt}\n{model}\n{content}".encode(), digest_size=16).hexdigest()
+
+def _get_cached_analysis(key: str) -> Optional[str]:
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        _analysis_cache.move_to_end(key)
+    return cached
+
+def _cache_analysis(key: str, analysis: str) -> None:
+    _analysis_cache[key] = analysis
+    _analysis_cache.move_to_end(key)
+    if len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
+
+# On-disk cache of text hash -> float32 embedding behind the LRU, opened on first use.
+# All SQLite work runs on one dedicated thread: it stays off the event loop, and the
+# connection is only ever used from the thread that created it
+_disk_cache: Optional[sqlite3.Connection] = None
+_disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+
+def _get_disk_cache() -> sqlite3.Connection:
+    global _disk_cache
+    if _disk_cache is None:
+        _disk_cache = sqlite3.connect(EMBEDDING_CACHE_PATH)
+        _disk_cache.execute("CREATE TABLE IF NOT EXISTS emb_cache (hash BLOB PRIMARY KEY, vec BLOB)")
+    return _disk_cache
+
+def _read_disk_embeddings(keys: List[bytes]) -> Dict[bytes, List[float]]:
+    found: Dict[bytes, List[float]] = {}
+    try:
+        cache = _get_disk_cache()
+        for i in range(0, len(keys), 500):  # Stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            rows = cache.execute(
+                f"SELECT hash, vec FROM emb_cache WHERE hash IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for key, vec in rows:
+                found[key] = np.frombuffer(vec, dtype=np.float32).tolist()
+    except sqlite3.Error as e:
+        print_error(f"Error reading embedding cache: {e}")
+    return found
+
+def _write_disk_embeddings(items: List[Tuple[bytes, List[float]]]) -> None:
+    try:
+        cache = _get_disk_cache()
+        cache.executemany(
+            "INSERT OR IGNORE INTO emb_cache (hash, vec) VALUES (?, ?)",
+            [(key, np.asarray(embedding, dtype=np.float32).tobytes()) for key, embedding in items]
+        )
+        cache.commit()
+    except sqlite3.Error as e:
+        print_error(f"Error writing embedding cache: {e}")
+
+async def _load_disk_embeddings(keys: List[bytes]) -> Dict[bytes, List[float]]:
+    """Look up embeddings on disk, promoting hits into the in-process LRU."""
+    if not keys:
+        return {}
+    found = await asyncio.get_running_loop().run_in_executor(_disk_executor, _read_disk_embeddings, keys)
+    for key, embedding in found.items():
+        _cache_embedding(key, embedding)
+    return found
+
+async def _save_disk_embeddings(items: List[Tuple[bytes, List[float]]]) -> None:
+    """Write embeddings to disk in one transaction."""
+    if items:
+        await asyncio.get_running_loop().run_in_executor(_disk_executor, _write_disk_embeddings, items)
+
+# Bounds concurrent embedding batch requests to respect OpenAI RPM limits
+_embedding_semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+# Back off with jitter on rate limits and transient server/connection errors,
+# so concurrent callers don't retry in lockstep
+_openai_retry = retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(6),
+    reraise=True
+)
+
+# Bounds how many chat completions are open at once across all callers. A slot is held until a
+# plain response arrives, or until a streamed response has been read to the end; request and
+# token pacing is left to _chat_limiter
+_chat_semaphore = asyncio.Semaphore(ANALYSIS_CONCURRENCY)
+
+# Paces chat requests within the account's per-minute request and token limits
+_chat_limiter = RateLimiter(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT)
+
+def _estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """Rough token cost of a chat request: ~4 characters per prompt token plus the completion budget."""
+    return sum(len(message['content']) for message in messages) // 4 + max_tokens
+
+@_openai_retry
+async def _create_chat_completion(**kwargs):
+    """Create a chat completion, backing off and retrying on transient errors."""
+    await _chat_limiter.acquire(_estimate_tokens(kwargs['messages'], kwargs.get('max_tokens', 0)))
+    async with _chat_semaphore:
+        return await openai_client.chat.completions.create(**kwargs)
+
+@_openai_retry
+async def _open_chat_stream(**kwargs):
+    """Open a streamed chat completion, backing off and retrying on transient errors.
+
+    Callers hold a chat semaphore slot around this and the reading of the stream.
+    """
+    await _chat_limiter.acquire(_estimate_tokens(kwargs['messages'], kwargs.get('max_tokens', 0)))
+    return await openai_client.chat.completions.create(stream=True, **kwargs)
+
+async def _complete_streamed(**kwargs) -> str:
+    """Run a chat completion as a stream and return its joined text."""
+    pieces = []
+    async with _chat_semaphore:
+        response = await _open_chat_stream(**kwargs)
+        async for chunk in response:
+            if chunk.choices:
+                pieces.append(chunk.choices[0].delta.content or "")
+    return "".join(pieces).strip()
+
+@_openai_retry
+async def _create_embeddings(**kwargs):
+    """Create embeddings, backing off and retrying on transient errors."""
+    return await openai_client.embeddings.create(**kwargs)
+
+# Tokenizer for the analysis model, preloaded at startup by load_tokenizer; tiktoken downloads its encoding
+# files the first time, so a failed load falls back to a character estimate instead of failing analyses
+_encoding: Optional[tiktoken.Encoding] = None
+_encoding_failed = False
+
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model(OPENAI_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")  # Encoding of the gpt-4o family
+        except Exception as e:
+            print_error(f"Error loading tokenizer, estimating tokens from characters: {e}")
+            _encoding_failed = True
+    return _encoding
+
+async def load_tokenizer() -> None:
+    """Load the tokenizer in a worker thread, so its download and parsing never block the event loop."""
+    await asyncio.to_thread(_get_encoding)
+
+def _truncate_tokens(text: str) -> str:
+    """Cut text down to MAX_INPUT_TOKENS tokens."""
+    encoding = _get_encoding()
+    if encoding is None:
+        max_chars = MAX_INPUT_TOKENS * 4
+        if len(text) <= max_chars:
+            return text
+        print_debug(f"Truncating analysis input from {len(text)} to {max_chars} characters")
+        return text[:max_chars]
+    
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= MAX_INPUT_TOKENS:
+        return text
+    print_debug(f"Truncating analysis input from {len(tokens)} to {MAX_INPUT_TOKENS} tokens")
+    return encoding.decode(tokens[:MAX_INPUT_TOKENS])
+
+def _pick_model(text: str) -> str:
+    """Use the small model by default and escalate only for long texts."""
+    return ANALYSIS_MODEL_LARGE if len(text) >= ANALYSIS_ESCALATION_CHARS else OPENAI_MODEL
+
+async def stream_text_analysis(text: str) -> AsyncIterator[str]:
+    """Stream the market analysis of text as content deltas arrive."""
+    model = _pick_model(text)
+    key = _analysis_key("text", model, text)
+    cached = _get_cached_analysis(key)
+    if cached is not None:
+        yield cached
+        return
+    
+    parts = []
+    async with _chat_semaphore:
+        response = await _open_chat_stream(
+            model=model,
+            messages=[
+                _TEXT_ANALYSIS_SYSTEM_MSG,
+                {"role": "user", "content": f"Analyze this Reddit post and its comments to extract valuable market insights:\n\n{_truncate_tokens(text)}"}
             ],
-            max_tokens=500,
+            max_tokens=ANALYSIS_MAX_TOKENS,
             temperature=0.6
         )
-        analysis = response.choices[0].message.content.strip()
-        print_success("Analysis completed successfully")
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    
+    # Only a fully received analysis is cached
+    analysis = "".join(parts).strip()
+    if analysis:
+        _cache_analysis(key, analysis)
+
+async def analyze_text(text: str) -> str:
+    """Analyze text using AI to extract market problems or startup ideas."""
+    print_debug("Analyzing post")
+    try:
+        parts = [part async for part in stream_text_analysis(text)]
+        analysis = "".join(parts).strip()
+        print_debug("Analysis completed successfully")
         return analysis
     except Exception as e:
         print_error(f"Error during analysis: {e}")
         return ""
 
-async def analyze_post_with_comments(post: dict) -> str:
-    """Analyze post content together with all its comments."""
+def _post_content(post: dict, comments: List[str]) -> str:
+    """Combine post content with its comments into the text sent for analysis, capped at MAX_INPUT_TOKENS."""
+    parts = [f"POST TITLE: {post['title']}", f"POST CONTENT: {post.get('selftext') or ''}"]
+    if comments:
+        parts.append("COMMENTS:")
+        parts.extend(f"Comment {i}:\n{comment}" for i, comment in enumerate(comments, 1))
+    return _truncate_tokens("\n\n".join(parts))
+
+def _post_analysis_messages(full_content: str) -> List[Dict]:
+    return [
+        _POST_ANALYSIS_SYSTEM_MSG,
+        {"role": "user", "content": f"Analyze this Reddit post and its comments to extract valuable market insights:\n\n{full_content}"}
+    ]
+
+async def analyze_post_with_comments(post: dict, comment_limit: Optional[int] = None) -> str:
+    """Analyze post content together with its comments, optionally only the first comment_limit."""
     from .reddit import fetch_comments_async  # Import here to avoid circular dependency
     
-    print_step("Fetching comments...")
+    print_debug("Fetching comments...")
     comments = await fetch_comments_async(post['id'])
+    if comment_limit is not None:
+        comments = comments[:comment_limit]
     
-    # Combine post content with comments
-    full_content = f"POST TITLE: {post['title']}\n\nPOST CONTENT: {post['selftext']}\n\n"
-    if comments:
-        full_content += "COMMENTS:\n"
-        for i, comment in enumerate(comments, 1):
-            full_content += f"\nComment {i}:\n{comment}\n"
+    full_content = _post_content(post, comments)
+    
+    key = _analysis_key("post", OPENAI_MODEL, full_content)
+    cached = _get_cached_analysis(key)
+    if cached is not None:
+        print_debug("Using cached analysis")
+        return cached
     
-    print_step("Analyzing post and comments...")
+    task = _analysis_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_analyze_post_content(full_content, key))
+        _analysis_inflight[key] = task
+        task.add_done_callback(lambda _: _analysis_inflight.pop(key, None))
+    # Shielded so one cancelled caller doesn't cancel the analysis for the others,
+    # but cancelled once no caller is left waiting for it
+    _analysis_waiters[key] = _analysis_waiters.get(key, 0) + 1
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o-mini-2024-07-18",
-            messages=[
-                {"role": "system", "content": """You are an expert market research analyst and startup advisor. 
-Analyze both the main post and its comments to identify:
-1. Clear market opportunities and gaps
-2. Specific user pain points and problems
-3. Potential startup ideas or business solutions
-4. Market size indicators and trends
-5. Competitive landscape insights
-6. Additional insights from comment discussions
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if _analysis_waiters.get(key) == 1:
+            task.cancel()
+        raise
+    finally:
+        _analysis_waiters[key] -= 1
+        if not _analysis_waiters[key]:
+            del _analysis_waiters[key]
 
-Focus on actionable insights and note when comments provide additional context or validation to the main post's points."""},
-                {"role": "user", "content": f"Analyze this Reddit post and its comments to extract valuable market insights:\n\n{full_content}"}
-            ],
-            max_tokens=1000,
+async def _analyze_post_content(full_content: str, key: str) -> str:
+    """Analyze combined post and comment text, reusing and filling the stored analysis cache."""
+    # Reuse a stored analysis if this exact post and comment text was analyzed before
+    content_hash = hashlib.blake2b(full_content.encode(), digest_size=16).hexdigest()
+    cached = await get_cached_analysis(content_hash, OPENAI_MODEL)
+    if cached:
+        print_debug("Using cached analysis")
+        _cache_analysis(key, cached)
+        return cached
+    
+    print_debug("Analyzing post and comments...")
+    try:
+        analysis = await _complete_streamed(
+            model=OPENAI_MODEL,
+            messages=_post_analysis_messages(full_content),
+            max_tokens=ANALYSIS_MAX_TOKENS,
             temperature=0.6
         )
-        analysis = response.choices[0].message.content.strip()
-        print_success("Analysis completed successfully")
+        if analysis:
+            _cache_analysis(key, analysis)
+            await store_cached_analysis(content_hash, OPENAI_MODEL, analysis)
+        print_debug("Analysis completed successfully")
         return analysis
     except Exception as e:
         print_error(f"Error during analysis: {e}")
@@ -73,97 +375,213 @@ Focus on actionable insights and note when comments provide additional context o
 
 async def generate_embedding(text: str) -> List[float]:
     """Generate embedding for text using advanced text embedding model."""
-    print_step("Generating embedding...")
+    key = _embedding_key(text)
+    cached = _get_cached_embedding(key)
+    if cached is None:
+        cached = (await _load_disk_embeddings([key])).get(key)
+    if cached is not None:
+        return cached
+    
+    print_debug("Generating embedding...")
     try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-ada-002",
+        response = await _create_embeddings(
+            model=EMBEDDING_MODEL,
             input=text
         )
-        print_success("Successfully generated embedding")
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        _cache_embedding(key, embedding)
+        await _save_disk_embeddings([(key, embedding)])
+        print_debug("Successfully generated embedding")
+        return embedding
     except Exception as e:
         print_error(f"Error generating embedding: {e}")
         return []
 
+async def get_query_embedding(query: str) -> List[float]:
+    """Embed a search query, normalized so repeated queries hit the embedding cache."""
+    return await generate_embedding(query.strip().lower())
+
 async def batch_generate_embeddings(texts: List[str], batch_size: int = 20) -> List[List[float]]:
-    """Generate embeddings for multiple texts in batches."""
-    print_step(f"Generating embeddings for {len(texts)} texts in batches of {batch_size}...")
-    all_embeddings = []
+    """Generate embeddings for multiple texts in batches, skipping texts already cached."""
+    keys = [_embedding_key(text) for text in texts]
+    all_embeddings: List[List[float]] = [_get_cached_embedding(key) for key in keys]
+    
+    # Only send each distinct uncached text once
+    missing: Dict[bytes, List[int]] = {}
+    for index, (key, embedding) in enumerate(zip(keys, all_embeddings)):
+        if embedding is None:
+            missing.setdefault(key, []).append(index)
     
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i + batch_size]
+    # Fill what we can from the on-disk cache before calling the API
+    for key, embedding in (await _load_disk_embeddings(list(missing))).items():
+        for index in missing.pop(key):
+            all_embeddings[index] = embedding
+    missing_keys = list(missing)
+    missing_texts = [texts[missing[key][0]] for key in missing_keys]
+    print_debug(
+        f"Generating embeddings for {len(missing_texts)} texts in batches of {batch_size} "
+        f"({len(texts) - sum(len(indexes) for indexes in missing.values())} cached)..."
+    )
+    
+    async def embed_batch(index: int, batch: List[str]) -> List[List[float]]:
         try:
-            print_step(f"Processing batch {i//batch_size + 1}/{(len(texts) + batch_size - 1)//batch_size}")
-            
-            response = await openai_client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=batch
-            )
-            
-            batch_embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(batch_embeddings)
-            print_success(f"Processed batch {i//batch_size + 1}")
+            async with _embedding_semaphore:
+                response = await _create_embeddings(
+                    model=EMBEDDING_MODEL,
+                    input=batch
+                )
+            return [item.embedding for item in response.data]
         except Exception as e:
-            print_error(f"Error in batch {i//batch_size + 1}: {e}")
+            print_error(f"Error in batch {index + 1}: {e}")
             # Fill with empty embeddings for failed batch
-            all_embeddings.extend([[] for _ in batch])
-        
+            return [[] for _ in batch]
+    
+    # Send all batches concurrently; gather keeps them in input order
+    batches = [missing_texts[i:i + batch_size] for i in range(0, len(missing_texts), batch_size)]
+    results = await asyncio.gather(*[embed_batch(index, batch) for index, batch in enumerate(batches)])
+    new_embeddings = [embedding for batch_embeddings in results for embedding in batch_embeddings]
+    
+    # Splice fresh embeddings back into their positions; failures are not cached
+    for key, embedding in zip(missing_keys, new_embeddings):
+        if embedding:
+            _cache_embedding(key, embedding)
+        for index in missing[key]:
+            all_embeddings[index] = embedding
+    await _save_disk_embeddings([(key, embedding) for key, embedding in zip(missing_keys, new_embeddings) if embedding])
+    
     print_success(f"Total embeddings generated: {len(all_embeddings)}")
     return all_embeddings 
 
-async def analyze_posts_batch(posts: List[dict], batch_size: int = 5) -> List[str]:
-    """Analyze multiple posts in a single batch to improve performance."""
-    print_step(f"Analyzing batch of {len(posts)} posts")
+async def _analyze_prepared_post(post: dict) -> str:
+    """Analyze one post whose comments are already attached, returning "" on failure."""
     try:
-        # Prepare all posts content
-        posts_content = []
-        for i, post in enumerate(posts, 1):
-            content = f"POST {i}:\nTitle: {post['title']}\nContent: {post.get('selftext', '')}\n\n"
-            if 'comments' in post:
-                content += "Comments:\n"
-                for j, comment in enumerate(post['comments'], 1):
-                    content += f"Comment {j}: {comment}\n"
-            posts_content.append(content)
-
-        # Split posts into batches
-        batches = [posts_content[i:i + batch_size] for i in range(0, len(posts_content), batch_size)]
-        all_analyses = []
-
-        for batch in batches:
-            batch_content = "\n---\n".join(batch)
-            response = await openai_client.chat.completions.create(
-                model="gpt-4o-mini-2024-07-18",
-                messages=[
-                    {"role": "system", "content": """You are an expert market research analyst and startup advisor. 
-Your task is to analyze multiple posts and their comments to determine whether they present problems or opportunities for startups.
-For each post, provide a separate analysis that identifies:
-1. Clear market opportunities and gaps
-2. Specific user pain points and problems
-3. Potential startup ideas or business solutions
-4. Market size indicators and trends
-5. Competitive landscape insights
+        return await _complete_streamed(
+            model=OPENAI_MODEL,
+            messages=_post_analysis_messages(_post_content(post, post.get('comments', []))),
+            max_tokens=ANALYSIS_MAX_TOKENS,
+            temperature=0.6
+        )
+    except Exception as e:
+        print_error(f"Error analyzing post {post.get('id')}: {e}")
+        return ""
 
-Format your response as:
-[POST 1]
-<your analysis for post 1>
+def _chunk_by_tokens(contents: List[str], batch_size: int) -> List[List[int]]:
+    """Group content indexes into chunks of at most batch_size posts and ANALYSIS_BATCH_INPUT_TOKENS input tokens."""
+    chunks: List[List[int]] = []
+    chunk_tokens = 0
+    for index, content in enumerate(contents):
+        tokens = len(content) // 4
+        if not chunks or len(chunks[-1]) >= batch_size or chunk_tokens + tokens > ANALYSIS_BATCH_INPUT_TOKENS:
+            chunks.append([])
+            chunk_tokens = 0
+        chunks[-1].append(index)
+        chunk_tokens += tokens
+    return chunks
 
-[POST 2]
-<your analysis for post 2>
+async def analyze_posts_batch(posts: List[dict], batch_size: int = 5) -> List[str]:
+    """Analyze several posts per chat request, returning one analysis per post in input order."""
+    print_debug(f"Analyzing batch of {len(posts)} posts")
+    try:
+        # Prepare all posts content
+        posts_content = [
+            f"POST {i} (id={post['id']}):\n{_post_content(post, post.get('comments', []))}"
+            for i, post in enumerate(posts, 1)
+        ]
 
-And so on for each post. Be precise, practical, and focus on actionable insights."""},
-                    {"role": "user", "content": f"Analyze these Reddit posts and their comments to extract valuable market insights:\n\n{batch_content}"}
-                ],
-                max_tokens=1000 * len(batch),  # Scale tokens based on batch size
-                temperature=0.6
-            )
+        async def analyze_chunk(indexes: List[int]) -> List[str]:
+            chunk_posts = [posts[i] for i in indexes]
+            try:
+                response = await _create_chat_completion(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        _BATCH_ANALYSIS_SYSTEM_MSG,
+                        {"role": "user", "content": "Analyze these Reddit posts and their comments to extract valuable market insights:\n\n"
+                            + "\n---\n".join(posts_content[i] for i in indexes)}
+                    ],
+                    max_tokens=ANALYSIS_MAX_TOKENS * len(indexes),  # Scale tokens based on batch size
+                    temperature=0.6,
+                    response_format={"type": "json_object"}
+                )
+                by_id = json.loads(response.choices[0].message.content)
+                analyses = [by_id.get(post['id']) for post in chunk_posts]
+            except (json.JSONDecodeError, TypeError, AttributeError) as e:
+                print_error(f"Unparseable batch analysis, analyzing posts one by one: {e}")
+                analyses = [None] * len(chunk_posts)
+            except APIError as e:
+                # Only this chunk falls back; the other chunks keep their results
+                print_error(f"Batch analysis request failed, analyzing posts one by one: {e}")
+                analyses = [None] * len(chunk_posts)
+            analyses = [
+                analysis.strip() if isinstance(analysis, str) else "" for analysis in analyses
+            ]
             
-            # Split the response into individual post analyses
-            analysis = response.choices[0].message.content.strip()
-            post_analyses = analysis.split('[POST')[1:]  # Split by [POST and remove empty first element
-            all_analyses.extend([a.split(']', 1)[1].strip() for a in post_analyses])
+            # Posts the model skipped get their own request
+            missing = [i for i, analysis in enumerate(analyses) if not analysis]
+            retried = await asyncio.gather(*[_analyze_prepared_post(chunk_posts[i]) for i in missing])
+            for i, analysis in zip(missing, retried):
+                analyses[i] = analysis
+            return analyses
+
+        # Send all chunks concurrently; gather keeps them in post order
+        chunks = _chunk_by_tokens(posts_content, batch_size)
+        results = await asyncio.gather(*[analyze_chunk(indexes) for indexes in chunks])
+        all_analyses = [analysis for chunk_analyses in results for analysis in chunk_analyses]
 
-        print_success(f"Successfully analyzed {len(posts)} posts in {len(batches)} batches")
+        print_debug(f"Successfully analyzed {len(posts)} posts in {len(chunks)} requests")
         return all_analyses
     except Exception as e:
         print_error(f"Error during batch analysis: {e}")
-        return [""] * len(posts)  # Return empty analyses for all posts in case of error 
\ No newline at end of file
+        return [""] * len(posts)  # Return empty analyses for all posts in case of error
+
+async def submit_analysis_batch(posts: List[dict]) -> Optional[str]:
+    """Submit post analyses to the OpenAI Batch API. Posts need a 'comments' list. Returns the batch id."""
+    try:
+        lines = [
+            json.dumps({
+                "custom_id": post['id'],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": OPENAI_MODEL,
+                    "messages": _post_analysis_messages(_post_content(post, post.get('comments', []))),
+                    "max_tokens": ANALYSIS_MAX_TOKENS,
+                    "temperature": 0.6
+                }
+            })
+            for post in posts
+        ]
+        batch_file = await openai_client.files.create(
+            file=("analysis_batch.jsonl", "\n".join(lines).encode()),
+            purpose="batch"
+        )
+        batch = await openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print_success(f"Submitted analysis batch {batch.id} with {len(posts)} posts")
+        return batch.id
+    except Exception as e:
+        print_error(f"Error submitting analysis batch: {e}")
+        return None
+
+async def get_analysis_batch_results(batch_id: str) -> Tuple[str, Dict[str, str]]:
+    """Return the batch status and, once it has completed, {post_id: analysis} for its successful requests."""
+    batch = await openai_client.batches.retrieve(batch_id)
+    if batch.status != "completed" or not batch.output_file_id:
+        return batch.status, {}
+    
+    output = await openai_client.files.content(batch.output_file_id)
+    analyses: Dict[str, str] = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get('response') or {}
+        if response.get('status_code') != 200:
+            print_error(f"Batch request {result.get('custom_id')} failed: {result.get('error')}")
+            continue
+        analysis = response['body']['choices'][0]['message']['content'].strip()
+        if analysis:
+            analyses[result['custom_id']] = analysis
+    return batch.status, analyses
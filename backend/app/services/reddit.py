@@ -1,36 +1,133 @@
-import requests
+import time
 import aiohttp
 import asyncio
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta, timezone
+import msgspec
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential
+)
+from datetime import datetime, timezone
 from ..config import REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT
-from ..utils.logging import print_step, print_success, print_error
-from ..utils.constants import PROBLEM_KEYWORDS
+from ..models.reddit import decode_listing, decode_comments
+from ..utils.logging import print_debug, print_step, print_success, print_error
+from ..utils.constants import (
+    PROBLEM_KEYWORDS,
+    TIMEFRAME_DELTAS,
+    MAX_COMMENT_CHARS,
+    REDDIT_CONNECTION_LIMIT,
+    SUBREDDIT_VALIDATION_TTL_SECONDS,
+    SUBREDDIT_VALIDATION_CACHE_SIZE
+)
 
-def get_reddit_token() -> Optional[str]:
-    """Get Reddit API access token."""
+# Shared HTTP session, so calls reuse pooled keep-alive connections instead of a new TLS handshake each
+_aiohttp_session: Optional[aiohttp.ClientSession] = None
+
+def _get_session() -> aiohttp.ClientSession:
+    """Return the shared aiohttp session, creating it on first use."""
+    global _aiohttp_session
+    if _aiohttp_session is None or _aiohttp_session.closed:
+        _aiohttp_session = aiohttp.ClientSession(
+            # Caps concurrent Reddit connections, caches DNS lookups for five minutes and keeps
+            # idle connections open for a minute so OAuth and data calls reuse their TLS sessions
+            connector=aiohttp.TCPConnector(
+                limit=REDDIT_CONNECTION_LIMIT,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            ),
+            headers={'User-Agent': REDDIT_USER_AGENT}
+        )
+    return _aiohttp_session
+
+async def close_sessions():
+    """Close the shared HTTP session."""
+    global _aiohttp_session
+    if _aiohttp_session is not None:
+        await _aiohttp_session.close()
+        _aiohttp_session = None
+
+class RedditTransientError(Exception):
+    """A Reddit response worth retrying (429 or 5xx)."""
+
+    def __init__(self, status: int, retry_after: Optional[str] = None):
+        super().__init__(f"Reddit returned status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+_backoff = wait_random_exponential(min=1, max=30)
+
+def _wait_for_retry(retry_state) -> float:
+    """Honour Reddit's Retry-After header when present, else back off exponentially with jitter."""
+    error = retry_state.outcome.exception()
+    if isinstance(error, RedditTransientError) and error.retry_after:
+        try:
+            return min(float(error.retry_after), 60)
+        except ValueError:
+            pass
+    return _backoff(retry_state)
+
+async def _reddit_request(method: str, url: str, **kwargs) -> Tuple[int, bytes]:
+    """Send a request through the shared session, retrying rate limits, 5xx and connection errors."""
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type((RedditTransientError, aiohttp.ClientError, asyncio.TimeoutError)),
+        wait=_wait_for_retry,
+        stop=stop_after_attempt(6),
+        reraise=True
+    ):
+        with attempt:
+            async with _get_session().request(method, url, **kwargs) as response:
+                if response.status == 429 or response.status >= 500:
+                    raise RedditTransientError(response.status, response.headers.get('Retry-After'))
+                return response.status, await response.read()
+
+# Cached Reddit OAuth token; tokens live about an hour, so one is reused until shortly before expiry
+_token_cache = {"token": None, "expires": 0.0}
+# Serializes refreshes, so concurrent fetches on a cold or expired cache share one token request
+_token_lock = asyncio.Lock()
+
+def _cached_token() -> Optional[str]:
+    if _token_cache["token"] and time.time() < _token_cache["expires"] - 60:
+        return _token_cache["token"]
+    return None
+
+async def get_reddit_token() -> Optional[str]:
+    """Get Reddit API access token, reusing the cached one while it is valid."""
+    token = _cached_token()
+    if token:
+        return token
+    
+    async with _token_lock:
+        # Another caller may have refreshed the token while we waited for the lock
+        token = _cached_token()
+        if token:
+            return token
+        return await _request_reddit_token()
+
+async def _request_reddit_token() -> Optional[str]:
+    """Request a new Reddit API access token and cache it."""
     print_step("Getting Reddit API token...")
-    auth = requests.auth.HTTPBasicAuth(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET)
     data = {
         'grant_type': 'client_credentials',
     }
-    headers = {
-        'User-Agent': REDDIT_USER_AGENT
-    }
     
     try:
-        response = requests.post(
+        status, body = await _reddit_request(
+            'POST',
             'https://www.reddit.com/api/v1/access_token',
-            auth=auth,
-            data=data,
-            headers=headers
+            auth=aiohttp.BasicAuth(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET),
+            data=data
         )
-        
-        if response.status_code == 200:
+        if status == 200:
+            payload = msgspec.json.decode(body)
+            _token_cache["token"] = payload['access_token']
+            _token_cache["expires"] = time.time() + payload.get('expires_in', 3600)
             print_success("Successfully obtained Reddit API token")
-            return response.json()['access_token']
+            return _token_cache["token"]
         else:
-            print_error(f"Failed to get Reddit token. Status code: {response.status_code}")
+            print_error(f"Failed to get Reddit token. Status code: {status}")
             return None
     except Exception as e:
         print_error(f"Error getting Reddit token: {e}")
@@ -39,12 +136,11 @@ def get_reddit_token() -> Optional[str]:
 async def fetch_posts_async(subreddit: str, size: int = 10) -> List[Dict]:
     """Async version of fetching posts."""
     print_step(f"Fetching posts from r/{subreddit}...")
-    token = get_reddit_token()
+    token = await get_reddit_token()
     if not token:
         return []
     
     headers = {
-        'User-Agent': REDDIT_USER_AGENT,
         'Authorization': f'Bearer {token}'
     }
     
@@ -54,28 +150,25 @@ async def fetch_posts_async(subreddit: str, size: int = 10) -> List[Dict]:
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    posts = data['data']['children']
-                    print_success(f"Successfully fetched {len(posts)} posts from r/{subreddit}")
-                    return [post['data'] for post in posts]
-                else:
-                    print_error(f"Failed to fetch posts. Status code: {response.status}")
-                    return []
+        status, body = await _reddit_request('GET', url, headers=headers, params=params)
+        if status == 200:
+            posts = decode_listing(body)
+            print_success(f"Successfully fetched {len(posts)} posts from r/{subreddit}")
+            return posts
+        else:
+            print_error(f"Failed to fetch posts. Status code: {status}")
+            return []
     except Exception as e:
         print_error(f"Error fetching posts: {e}")
         return []
 
 async def fetch_comments_async(post_id: str) -> List[str]:
-    """Fetch all comments for a post."""
-    token = get_reddit_token()
+    """Fetch top-level comments for a post, up to a total character budget."""
+    token = await get_reddit_token()
     if not token:
         return []
     
     headers = {
-        'User-Agent': REDDIT_USER_AGENT,
         'Authorization': f'Bearer {token}'
     }
     
@@ -86,18 +179,19 @@ async def fetch_comments_async(post_id: str) -> List[str]:
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if len(data) > 1:  # Reddit returns [post_data, comments_data]
-                        comments = data[1]['data']['children']
-                        return [
-                            comment['data']['body'] 
-                            for comment in comments 
-                            if comment['kind'] == 't1' and len(comment['data']['body']) > 50  # Filter short comments
-                        ]
-                return []
+        status, body = await _reddit_request('GET', url, headers=headers, params=params)
+        if status == 200:
+            comments = []
+            total_chars = 0
+            for comment in decode_comments(body):
+                if len(comment) <= 50:  # Filter short comments
+                    continue
+                comments.append(comment)
+                total_chars += len(comment)
+                if total_chars > MAX_COMMENT_CHARS:
+                    break
+            return comments
+        return []
     except Exception as e:
         print_error(f"Error fetching comments: {e}")
         return []
@@ -105,20 +199,24 @@ async def fetch_comments_async(post_id: str) -> List[str]:
 async def fetch_posts_by_timeframe(subreddit: str, timeframe: str = 'week', size: int = 100) -> List[Dict]:
     """Fetch posts from a subreddit within a specific timeframe."""
     print_step(f"Fetching posts from r/{subreddit} for the last {timeframe}...")
-    token = get_reddit_token()
+    if timeframe not in TIMEFRAME_DELTAS:
+        print_error(f"Invalid timeframe: {timeframe}")
+        return []
+    
+    # Compare raw UTC epochs instead of building a datetime per post
+    cutoff_ts = (datetime.now(timezone.utc) - TIMEFRAME_DELTAS[timeframe]).timestamp()
+    
+    token = await get_reddit_token()
     if not token:
         return []
     
     headers = {
-        'User-Agent': REDDIT_USER_AGENT,
         'Authorization': f'Bearer {token}'
     }
 
-    seen_ids = set()
-    all_posts = []
+    posts_by_id: Dict[str, Dict] = {}
 
     async def search_keyword(keyword: str):
-        print_step(f"Searching for keyword: {keyword}")
         try:
             url = f"https://oauth.reddit.com/r/{subreddit}/search"
             params = {
@@ -130,70 +228,61 @@ async def fetch_posts_by_timeframe(subreddit: str, timeframe: str = 'week', size
                 'type': 'link'
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        posts = data['data']['children']
-                        
-                        keyword_posts = []
-                        for post in posts:
-                            post_data = post['data']
-                            if post_data['id'] not in seen_ids:
-                                seen_ids.add(post_data['id'])
-                                keyword_posts.append(post_data)
-                                print_success(f"Found post with keyword '{keyword}': {post_data['title'][:100]}")
-                        return keyword_posts
-                    else:
-                        print_error(f"Failed to fetch posts for keyword '{keyword}'. Status code: {response.status}")
-                        return []
+            status, body = await _reddit_request('GET', url, headers=headers, params=params)
+            if status == 200:
+                posts = decode_listing(body)
+                prev_len = len(posts_by_id)
+                for post in posts:
+                    posts_by_id.setdefault(post['id'], post)
+                print_debug(f"keyword={keyword} new={len(posts_by_id) - prev_len}")
+            else:
+                print_error(f"Failed to fetch posts for keyword '{keyword}'. Status code: {status}")
         except Exception as e:
             print_error(f"Error fetching posts for keyword '{keyword}': {e}")
-            return []
 
     # Search all keywords in parallel
-    keyword_results = await asyncio.gather(*[
+    await asyncio.gather(*[
         search_keyword(keyword) for keyword in PROBLEM_KEYWORDS
     ])
     
-    # Combine all results
-    for posts in keyword_results:
-        all_posts.extend(posts)
-    
     # Filter by timeframe
-    now = datetime.now()
-    if timeframe == 'week':
-        start_time = now - timedelta(days=7)
-    elif timeframe == 'month':
-        start_time = now - timedelta(days=30)
-    elif timeframe == 'year':
-        start_time = now - timedelta(days=365)
-    else:
-        print_error(f"Invalid timeframe: {timeframe}")
-        return []
-
-    filtered_posts = [
-        post for post in all_posts 
-        if datetime.fromtimestamp(post['created_utc']) >= start_time
-    ]
+    filtered_posts = [post for post in posts_by_id.values() if post['created_utc'] >= cutoff_ts]
     
     print_success(f"Successfully fetched {len(filtered_posts)} unique posts from r/{subreddit}")
     return filtered_posts
 
-def validate_subreddit(subreddit: str) -> bool:
-    """Validate if a subreddit exists."""
-    print_step(f"Validating r/{subreddit}...")
+# Lowercased subreddit name -> (is_valid, checked_at), so repeat validations skip Reddit;
+# least recently used names are evicted first, since the names come from user input
+_validation_cache: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+
+async def validate_subreddit(subreddit: str) -> bool:
+    """Validate if a subreddit exists, reusing results from the last SUBREDDIT_VALIDATION_TTL_SECONDS."""
+    key = subreddit.lower()
+    cached = _validation_cache.get(key)
+    if cached and time.time() - cached[1] < SUBREDDIT_VALIDATION_TTL_SECONDS:
+        print_debug(f"Using cached validation for r/{subreddit}")
+        _validation_cache.move_to_end(key)
+        return cached[0]
     
-    headers = {
-        'User-Agent': REDDIT_USER_AGENT
-    }
+    is_valid = await _check_subreddit(subreddit)
+    if is_valid is None:
+        return False
+    _validation_cache[key] = (is_valid, time.time())
+    _validation_cache.move_to_end(key)
+    if len(_validation_cache) > SUBREDDIT_VALIDATION_CACHE_SIZE:
+        _validation_cache.popitem(last=False)
+    return is_valid
+
+async def _check_subreddit(subreddit: str) -> Optional[bool]:
+    """Ask Reddit whether a subreddit exists and is usable; None if the answer may change soon."""
+    print_step(f"Validating r/{subreddit}...")
     
     url = f"https://www.reddit.com/r/{subreddit}/about.json"
     
     try:
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
+        status, body = await _reddit_request('GET', url)
+        if status == 200:
+            data = msgspec.json.decode(body)
             if not data.get('data'):
                 print_error(f"r/{subreddit} does not exist")
                 return False
@@ -202,9 +291,13 @@ def validate_subreddit(subreddit: str) -> bool:
                 return False
             print_success(f"r/{subreddit} exists and is valid")
             return True
-        else:
-            print_error(f"r/{subreddit} does not exist or is private")
+        elif status == 404:
+            print_error(f"r/{subreddit} does not exist")
             return False
+        else:
+            # Private, quarantined or blocked subreddits and rejected requests can change; don't cache them
+            print_error(f"r/{subreddit} is not accessible (status {status})")
+            return None
     except Exception as e:
         print_error(f"Error validating r/{subreddit}: {e}")
-        return False 
\ No newline at end of file
+        return None 
\ No newline at end of file
@@ -1,21 +1,83 @@
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta, timezone
-from ..utils.logging import print_step, print_success, print_error
-from .reddit import fetch_posts_async, fetch_posts_by_timeframe, fetch_comments_async
-from .openai_service import analyze_post_with_comments, generate_embedding, analyze_posts_batch
+from typing import List, Dict, Optional, Set, Tuple
+from ..utils.logging import print_debug, print_step, print_success, print_error, progress
+from .reddit import fetch_posts_async, fetch_posts_by_timeframe, fetch_comments_async, validate_subreddit
+from .openai_service import (
+    analyze_post_with_comments,
+    get_query_embedding,
+    batch_generate_embeddings,
+    analyze_posts_batch,
+    submit_analysis_batch,
+    get_analysis_batch_results
+)
 from .supabase_service import (
-    store_post_with_embedding,
-    update_post_analysis,
-    get_analyzed_posts,
-    get_last_search,
-    update_search_history,
-    semantic_search_with_offset
+    store_posts_batch,
+    get_existing_analyses,
+    bulk_update_analyses,
+    get_unanalyzed_posts,
+    semantic_search_with_offset,
+    get_posts_by_ids,
+    get_semantic_cache_hit,
+    store_semantic_cache
 )
+import io
+import time
 import asyncio
+from collections import OrderedDict
+import numpy as np
 from ..utils.task_manager import task_manager
+from ..utils.constants import (
+    DEFAULT_EF_SEARCH,
+    SUBREDDIT_CONCURRENCY,
+    SEMANTIC_CACHE_THRESHOLD,
+    QUERY_CACHE_SIZE,
+    QUERY_CACHE_TTL_SECONDS
+)
+
+# Bounds concurrent subreddit processing to stay within Reddit/OpenAI rate limits
+_subreddit_semaphore = asyncio.Semaphore(SUBREDDIT_CONCURRENCY)
+
+# In-process semantic cache in front of the database one:
+# (search params, normalized query) -> (unit query embedding, posts, stored_at)
+_query_cache: "OrderedDict[Tuple, Tuple[np.ndarray, List[Dict], float]]" = OrderedDict()
+
+def _unit_vector(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def _get_query_cache_hit(params: Tuple, query_vector: np.ndarray) -> Optional[List[Dict]]:
+    """Return cached posts for the most similar fresh query with the same params, if close enough."""
+    now = time.monotonic()
+    for key in [key for key, (_, _, stored_at) in _query_cache.items() if now - stored_at > QUERY_CACHE_TTL_SECONDS]:
+        del _query_cache[key]
+    
+    candidates = [key for key in _query_cache if key[0] == params]
+    if not candidates:
+        return None
+    
+    scores = np.stack([_query_cache[key][0] for key in candidates]) @ query_vector
+    best = int(np.argmax(scores))
+    if scores[best] < SEMANTIC_CACHE_THRESHOLD:
+        return None
+    
+    _query_cache.move_to_end(candidates[best])
+    # Hand out copies so the analysis step of one request doesn't mutate the cached posts
+    return [dict(post) for post in _query_cache[candidates[best]][1]]
+
+def _store_query_cache(params: Tuple, query: str, query_vector: np.ndarray, posts: List[Dict]) -> None:
+    """Cache pipeline results for a query, evicting the least recently used entry when full."""
+    key = (params, query.strip().lower())
+    cached_posts = [{k: v for k, v in post.items() if k != 'comments'} for post in posts]
+    _query_cache[key] = (query_vector, cached_posts, time.monotonic())
+    _query_cache.move_to_end(key)
+    if len(_query_cache) > QUERY_CACHE_SIZE:
+        _query_cache.popitem(last=False)
+
+def _embedding_text(post: Dict) -> str:
+    """Build the text embedded for a post; stored vectors all come from this format."""
+    return f"{post.get('title') or ''}\n{post.get('selftext') or ''}"
 
 async def process_subreddit_posts(subreddit: str, post_limit: int) -> int:
-    """Process posts from a single subreddit."""
+    """Process posts from a single subreddit. Returns the number of newly stored posts."""
     print_step(f"Processing r/{subreddit}...")
     posts = await fetch_posts_async(subreddit, size=post_limit)
     
@@ -25,50 +87,69 @@ async def process_subreddit_posts(subreddit: str, post_limit: int) -> int:
     
     print_success(f"Found {len(posts)} posts")
     
-    # Process posts in parallel
-    async def process_single_post(post):
-        try:
-            # Check if post exists and has analysis
-            exists = await get_analyzed_posts(subreddit, datetime.fromtimestamp(post['created_utc']))
-            if exists:
-                return True
-            
-            # Generate embedding and store post in parallel
-            content = post.get('title', '') + "\n" + post.get('selftext', '')
-            embedding = await generate_embedding(content)
-            
-            if not embedding:
-                return False
-            
-            # Store post with embedding
-            return await store_post_with_embedding(post, embedding)
-        except Exception as e:
-            print_error(f"Error processing post {post.get('id')}: {str(e)}")
-            return False
+    # Skip posts that are already stored, checked with one query for the whole batch. Posts the
+    # in-memory index doesn't know skip the query: if one is stored after all, the
+    # insert-or-ignore below leaves it untouched
+    existing = await get_existing_analyses([post['id'] for post in posts], skip_unindexed=True)
+    if existing is None:
+        return 0
+    new_posts = [post for post in posts if post['id'] not in existing]
+    if not new_posts:
+        return 0
     
-    # Process all posts concurrently
-    results = await asyncio.gather(*[process_single_post(post) for post in posts])
-    successful_posts = sum(1 for result in results if result)
+    # Embed all new posts in batched API calls instead of one request per post
+    contents = [_embedding_text(post) for post in new_posts]
+    embeddings = await batch_generate_embeddings(contents, batch_size=100)
+    
+    # Store all embedded posts in one insert-or-ignore, so a post stored (and analyzed)
+    # by a concurrent run since the lookup above keeps its analysis
+    embedded = [(post, embedding) for post, embedding in zip(new_posts, embeddings) if embedding]
+    if not embedded:
+        return 0
+    successful_posts = await store_posts_batch(
+        [post for post, _ in embedded],
+        [embedding for _, embedding in embedded],
+        ignore_duplicates=True
+    )
     
     return successful_posts
 
-async def fetch_and_filter_posts(subreddits: List[str], post_limit: int = 100) -> int:
-    """Fetch and process posts from multiple subreddits in parallel."""
+async def process_subreddits(
+    subreddits: List[str],
+    post_limit: int = 100,
+    validate: bool = False
+) -> Dict[str, Optional[int]]:
+    """Fetch and process posts from multiple subreddits in parallel.
+
+    Returns {subreddit: newly stored posts}; with validate, subreddits that fail validation map to None.
+    """
     print_step(f"Processing {len(subreddits)} subreddits in parallel...")
     
-    # Process all subreddits concurrently
-    results = await asyncio.gather(
-        *[process_subreddit_posts(subreddit, post_limit) for subreddit in subreddits]
-    )
-    
-    # Sum up the successful posts from all subreddits
-    total_successful = sum(results)
+    async def process(subreddit):
+        # Each subreddit starts processing as soon as its own validation finishes
+        if validate and not await validate_subreddit(subreddit):
+            return None
+        async with _subreddit_semaphore:
+            return await process_subreddit_posts(subreddit, post_limit)
     
-    for subreddit, successful in zip(subreddits, results):
-        print(f"Processed {successful} posts from r/{subreddit}")
+    # Process all subreddits concurrently, bounded by the subreddit semaphore
+    results = dict(zip(subreddits, await asyncio.gather(*[process(subreddit) for subreddit in subreddits])))
     
-    print(f"\nTotal processed: {total_successful}")
-    return total_successful
+    # Build the summary once and emit it in a single write
+    summary = io.StringIO()
+    for subreddit, successful in results.items():
+        if successful is None:
+            summary.write(f"Skipped invalid subreddit r/{subreddit}\n")
+        else:
+            summary.write(f"Stored {successful} new posts from r/{subreddit}\n")
+    summary.write(f"Total new posts: {sum(successful or 0 for successful in results.values())}")
+    print_success(summary.getvalue())
+    return results
+
+async def fetch_and_filter_posts(subreddits: List[str], post_limit: int = 100) -> int:
+    """Fetch and process posts from multiple subreddits in parallel. Returns the number of newly stored posts."""
+    results = await process_subreddits(subreddits, post_limit)
+    return sum(results.values())
 
 async def smart_analysis_pipeline(
     query: str, 
@@ -78,6 +159,7 @@ async def smart_analysis_pipeline(
     analyze_count: Optional[int] = None,
     comment_limit: int = 5,
     batch_size: int = 5,
+    ef_search: int = DEFAULT_EF_SEARCH,
     user_id: Optional[str] = None,
     task_id: Optional[str] = None
 ) -> List[Dict]:
@@ -88,7 +170,30 @@ async def smart_analysis_pipeline(
             print_step(f"Searching in r/{subreddit}")
         
         await _update_task_status(task_id, 'processing')
-        similar_posts = await _fetch_and_search_posts(query, subreddit, min_similarity, max_posts)
+        
+        # Reuse the posts found for near-identical earlier queries from the semantic cache;
+        # they still go through the analysis step below, which skips already analyzed posts
+        query_embedding = await get_query_embedding(query)
+        cache_params = (subreddit.lower() if subreddit else None, min_similarity, max_posts)
+        query_vector = _unit_vector(query_embedding) if query_embedding else None
+        similar_posts = None
+        cache_hit = False
+        if query_vector is not None:
+            similar_posts = _get_query_cache_hit(cache_params, query_vector)
+            if similar_posts:
+                print_success(f"In-process cache hit: {len(similar_posts)} posts")
+            else:
+                cached_ids = await get_semantic_cache_hit(query_embedding, subreddit, min_similarity, max_posts)
+                if cached_ids:
+                    similar_posts = await get_posts_by_ids(cached_ids, query_embedding)
+                    if similar_posts:
+                        print_success(f"Semantic cache hit: {len(similar_posts)} posts")
+            cache_hit = bool(similar_posts)
+        
+        if not cache_hit:
+            similar_posts = await _fetch_and_search_posts(
+                query, subreddit, min_similarity, max_posts, ef_search, query_embedding
+            )
         
         if not similar_posts:
             return []
@@ -96,6 +201,16 @@ async def smart_analysis_pipeline(
         posts_to_analyze = _get_posts_to_analyze(similar_posts, analyze_count)
         await _process_posts_analysis(posts_to_analyze, batch_size)
         
+        if query_vector is not None:
+            # Keep results with failed analyses out of the in-process cache so they are retried
+            if all(post.get('analysis') for post in posts_to_analyze):
+                _store_query_cache(cache_params, query, query_vector, similar_posts)
+            if not cache_hit:
+                await store_semantic_cache(
+                    query_embedding, subreddit, min_similarity, max_posts,
+                    [post['id'] for post in similar_posts]
+                )
+        
         return similar_posts
     except Exception as e:
         print_error(f"Error in smart analysis pipeline: {str(e)}")
@@ -111,27 +226,36 @@ async def _fetch_and_search_posts(
     query: str,
     subreddit: Optional[str],
     min_similarity: float,
-    max_posts: int
+    max_posts: int,
+    ef_search: int = DEFAULT_EF_SEARCH,
+    query_embedding: Optional[List[float]] = None
 ) -> List[Dict]:
     """Fetch new posts and search for similar ones."""
-    print_step(f"Fetching new posts...")
+    print_step("Fetching new posts...")
     
-    # Generate query embedding in parallel with post fetching
-    query_embedding_task = generate_embedding(query)
+    # Search the stored posts while new ones are fetched; the search only needs
+    # to be repeated if the fetch actually stored something new
+    search_task = asyncio.create_task(semantic_search_with_offset(
+        query, subreddit, min_similarity, max_posts,
+        ef_search=ef_search, query_embedding=query_embedding
+    ))
     
     if subreddit:
         # Single subreddit search
-        posts_task = process_subreddit_posts(subreddit, 100)
-        # Wait for both tasks
-        query_embedding, _ = await asyncio.gather(query_embedding_task, posts_task)
-        similar_posts = await semantic_search_with_offset(query, subreddit, min_similarity, max_posts, query_embedding)
+        new_post_count = await process_subreddit_posts(subreddit, 100)
     else:
         # Multi-subreddit search
         default_subreddits = ["startups", "Entrepreneur", "SaaS"]
-        posts_task = fetch_and_filter_posts(default_subreddits, 100)
-        # Wait for both tasks
-        query_embedding, _ = await asyncio.gather(query_embedding_task, posts_task)
-        similar_posts = await semantic_search_with_offset(query, None, min_similarity, max_posts, query_embedding)
+        new_post_count = await fetch_and_filter_posts(default_subreddits, 100)
+    
+    if new_post_count > 0:
+        search_task.cancel()
+        similar_posts = await semantic_search_with_offset(
+            query, subreddit, min_similarity, max_posts,
+            ef_search=ef_search, query_embedding=query_embedding
+        )
+    else:
+        similar_posts = await search_task
     
     if not similar_posts:
         print_error("No similar posts found")
@@ -150,51 +274,72 @@ async def _process_posts_analysis(posts: List[Dict], batch_size: int) -> None:
     if not posts_needing_analysis:
         return
 
-    # Fetch comments and generate embeddings for all posts in parallel
+    # Posts come from the vector search, so they are already stored with embeddings;
+    # only their comments are needed for the analysis
     async def prepare_post(post):
-        comments_task = fetch_comments_async(post['id'])
-        content = post['title'] + "\n" + post.get('selftext', '')
-        embedding_task = generate_embedding(content)
-        
-        post['comments'], post['embedding'] = await asyncio.gather(comments_task, embedding_task)
+        post['comments'] = await fetch_comments_async(post['id'])
         return post
     
-    print_step(f"Preparing {len(posts_needing_analysis)} posts (fetching comments and generating embeddings)...")
+    print_step(f"Preparing {len(posts_needing_analysis)} posts (fetching comments)...")
     prepared_posts = await asyncio.gather(*[prepare_post(post) for post in posts_needing_analysis])
     
-    # Filter out posts where embedding generation failed
-    valid_posts = [post for post in prepared_posts if post.get('embedding')]
+    # Process in batches
+    batches = [prepared_posts[i:i + batch_size] for i in range(0, len(prepared_posts), batch_size)]
+    print_step(f"Analyzing {len(prepared_posts)} posts in {len(batches)} batches...")
     
-    if not valid_posts:
-        print_error("No valid posts to analyze after preparation")
-        return
+    # Collect (post_id, analysis) pairs from all batches and write them in one update
+    updates: List[Tuple[str, str]] = []
     
-    # Process in batches
-    batches = [valid_posts[i:i + batch_size] for i in range(0, len(valid_posts), batch_size)]
-    print_step(f"Analyzing {len(valid_posts)} posts in {len(batches)} batches...")
-    
-    # Process each batch in parallel and store results immediately
-    async def process_batch(batch):
-        analyses = await analyze_posts_batch(batch, batch_size)
-        # Store results for this batch immediately
-        store_tasks = []
-        for post, analysis in zip(batch, analyses):
-            if analysis:
-                store_tasks.append(
-                    store_post_with_embedding(post, post['embedding'], analysis)
-                )
-                post['analysis'] = analysis
+    with progress(len(prepared_posts), "Analyzing posts") as bar:
+        async def process_batch(batch):
+            analyses = await analyze_posts_batch(batch, batch_size)
+            for post, analysis in zip(batch, analyses):
+                if analysis:
+                    post['analysis'] = analysis
+                    updates.append((post['id'], analysis))
+            bar.update(len(batch))
         
-        if store_tasks:
-            results = await asyncio.gather(*store_tasks)
-            successful = sum(1 for r in results if r)
-            print_success(f"Stored {successful}/{len(store_tasks)} posts from batch")
+        # Process all batches concurrently; chat requests are bounded in openai_service
+        await asyncio.gather(*[process_batch(batch) for batch in batches])
     
-    # Process all batches concurrently
-    await asyncio.gather(*[process_batch(batch) for batch in batches])
+    if updates:
+        updated = await bulk_update_analyses(updates)
+        print_success(f"Stored {updated}/{len(updates)} analyses")
+
+async def submit_subreddit_analysis_batch(subreddit: str, limit: int) -> Tuple[Optional[str], int]:
+    """Queue analyses of a subreddit's stored but unanalyzed posts on the OpenAI Batch API.
 
-async def analyze_problem_posts(subreddit: str, timeframe: str = 'week', min_score: int = 5) -> List[Dict]:
-    """Find and analyze problem-related posts."""
+    Returns (batch_id, post_count); batch_id is None when there was nothing to submit or submission failed.
+    """
+    posts = await get_unanalyzed_posts(subreddit, limit)
+    if not posts:
+        print_step(f"No unanalyzed posts stored for r/{subreddit}")
+        return None, 0
+    
+    async def prepare_post(post):
+        post['comments'] = await fetch_comments_async(post['id'])
+        return post
+    
+    print_step(f"Preparing {len(posts)} posts (fetching comments)...")
+    prepared_posts = await asyncio.gather(*[prepare_post(post) for post in posts])
+    return await submit_analysis_batch(prepared_posts), len(prepared_posts)
+
+async def collect_analysis_batch(batch_id: str) -> Tuple[str, int]:
+    """Check an analysis batch and store its analyses once it completes. Returns (status, stored count)."""
+    status, analyses = await get_analysis_batch_results(batch_id)
+    if not analyses:
+        return status, 0
+    updated = await bulk_update_analyses(list(analyses.items()))
+    print_success(f"Stored {updated}/{len(analyses)} analyses from batch {batch_id}")
+    return status, updated
+
+async def analyze_problem_posts(
+    subreddit: str,
+    timeframe: str = 'week',
+    min_score: int = 5,
+    exclude_ids: Optional[Set[str]] = None
+) -> List[Dict]:
+    """Find and analyze problem-related posts, skipping posts in exclude_ids."""
     try:
         # Find posts with problem-related keywords
         posts = await fetch_posts_by_timeframe(subreddit, timeframe)
@@ -202,50 +347,68 @@ async def analyze_problem_posts(subreddit: str, timeframe: str = 'week', min_sco
             print_step(f"No posts found in r/{subreddit} for timeframe: {timeframe}")
             return []
         
-        # Filter by score
-        scored_posts = [post for post in posts if post['score'] >= min_score]
+        # Filter by score and drop posts that are already analyzed
+        exclude_ids = exclude_ids or set()
+        scored_posts = [
+            post for post in posts
+            if post['score'] >= min_score and post['id'] not in exclude_ids
+        ]
         if not scored_posts:
-            print_step(f"No posts found with score >= {min_score}")
+            print_step(f"No new posts found with score >= {min_score}")
             return []
         
-        # Process posts in parallel
-        async def process_post(post):
-            try:
-                print_step(f"Processing post: {post['title'][:100]}...")
-                
-                # Fetch comments and generate embedding in parallel
-                comments_task = fetch_comments_async(post['id'])
-                content = post['title'] + "\n" + post.get('selftext', '')
-                embedding_task = generate_embedding(content)
-                
-                # Wait for both tasks to complete
-                post['comments'], embedding = await asyncio.gather(comments_task, embedding_task)
-                
-                if not embedding:
-                    return None
-                
-                # Analyze post with comments
-                analysis = await analyze_post_with_comments(post)
-                if not analysis:
-                    return None
-                
+        # Reuse analyses already stored for these posts, found with one batched lookup
+        existing = await get_existing_analyses([post['id'] for post in scored_posts]) or {}
+        reused_posts = []
+        for post in scored_posts:
+            if existing.get(post['id']):
+                post['analysis'] = existing[post['id']]
+                reused_posts.append(post)
+        scored_posts = [post for post in scored_posts if not post.get('analysis')]
+        if not scored_posts:
+            return reused_posts
+        
+        # Embed all candidates in batched API calls
+        contents = [_embedding_text(post) for post in scored_posts]
+        embeddings = await batch_generate_embeddings(contents, batch_size=128)
+        embedded = [(post, embedding) for post, embedding in zip(scored_posts, embeddings) if embedding]
+        
+        # Analyze posts concurrently; chat requests are bounded in openai_service
+        with progress(len(embedded), "Analyzing posts") as bar:
+            async def analyze_post(post):
+                try:
+                    print_debug(f"Processing post: {post['title'][:100]}...")
+                    return await analyze_post_with_comments(post)
+                finally:
+                    bar.update(1)
+            
+            analyses = await asyncio.gather(
+                *[analyze_post(post) for post, _ in embedded],
+                return_exceptions=True
+            )
+        
+        analyzed = []
+        for (post, embedding), analysis in zip(embedded, analyses):
+            if isinstance(analysis, Exception):
+                print_error(f"Error processing post {post.get('id')}: {str(analysis)}")
+            elif analysis:
                 post['analysis'] = analysis
-                
-                # Store post with analysis and embedding
-                if await store_post_with_embedding(post, embedding, analysis):
-                    print_success(f"Stored post with analysis: {post['id']}")
-                    return post
-                
-                return None
-            except Exception as e:
-                print_error(f"Error processing post {post.get('id')}: {str(e)}")
-                return None
-        
-        # Process all posts concurrently
-        results = await asyncio.gather(*[process_post(post) for post in scored_posts])
-        analyzed_posts = [post for post in results if post is not None]
-        
-        return analyzed_posts
+                analyzed.append((post, embedding))
+        
+        if not analyzed:
+            return reused_posts
+        
+        # Store all analyzed posts in one upsert
+        analyzed_posts = [post for post, _ in analyzed]
+        stored = await store_posts_batch(
+            analyzed_posts,
+            [embedding for _, embedding in analyzed],
+            [post['analysis'] for post in analyzed_posts]
+        )
+        if not stored:
+            return reused_posts
+        
+        return reused_posts + analyzed_posts
     except Exception as e:
         print_error(f"Error in analyze_problem_posts: {str(e)}")
         return [] 
\ No newline at end of file
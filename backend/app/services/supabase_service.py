@@ -1,34 +1,84 @@
-from typing import List, Dict, Optional
-from datetime import datetime, timezone
+import asyncio
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timedelta, timezone
 from ..config import supabase
-from ..utils.logging import print_step, print_success, print_error
+from .. import db
+from .flat_index import flat_index, quantize_embedding
+from ..utils.logging import print_debug, print_step, print_success, print_error
+from ..utils.constants import (
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_DAYS,
+    DEFAULT_EF_SEARCH,
+    FLAT_PREFILTER_MARGIN
+)
 
-async def store_post_with_embedding(post: dict, embedding: List[float], analysis: str = None) -> bool:
+# Columns returned to callers; the embedding column (~6 KB per row) is left out
+POST_COLUMNS = "id, title, selftext, analysis, subreddit, url, score, created_at"
+
+def _post_row(post: dict, embedding: List[float], analysis: str = None) -> Dict:
+    """Build a reddit_posts row from a Reddit post."""
+    embedding_i8, embedding_scale = quantize_embedding(embedding)
+    return {
+        "id": post.get('id'),
+        "title": post.get('title'),
+        "selftext": post.get('selftext', ''),
+        "analysis": analysis,
+        "subreddit": post.get('subreddit'),
+        "url": post.get('url'),
+        "score": post.get('score'),
+        "embedding": embedding,
+        # int8 copy read by the in-memory search; PostgREST takes bytea as a \x-prefixed hex string
+        "embedding_i8": "\\x" + embedding_i8.hex(),
+        "embedding_scale": embedding_scale,
+        # Convert Unix timestamp to ISO format
+        "created_at": datetime.fromtimestamp(post.get('created_utc'), tz=timezone.utc).isoformat()
+    }
+
+# Columns staged through COPY, in record order; the embedding is staged as text and cast to vector
+_COPY_COLUMNS = (
+    "id", "title", "selftext", "analysis", "subreddit", "url", "score",
+    "embedding", "embedding_i8", "embedding_scale", "created_at"
+)
+
+def _post_record(post: dict, embedding: List[float], analysis: str = None) -> Tuple:
+    """Build a COPY record for reddit_posts from a Reddit post, in _COPY_COLUMNS order."""
+    embedding_i8, embedding_scale = quantize_embedding(embedding)
+    return (
+        post.get('id'),
+        post.get('title'),
+        post.get('selftext', ''),
+        analysis,
+        post.get('subreddit'),
+        post.get('url'),
+        post.get('score'),
+        db.vector_literal(embedding),
+        embedding_i8,
+        embedding_scale,
+        datetime.fromtimestamp(post.get('created_utc'), tz=timezone.utc)
+    )
+
+async def store_post_with_embedding(
+    post: dict,
+    embedding: List[float],
+    analysis: str = None,
+    ignore_duplicates: bool = False
+) -> bool:
     """Store post with its embedding, optionally including analysis."""
     try:
-        print_step(f"Storing: {post.get('title')[:50]}...")
-        
-        # Convert Unix timestamp to ISO format
-        created_at = datetime.fromtimestamp(post.get('created_utc'), tz=timezone.utc).isoformat()
-        
-        # Prepare the data
-        data = {
-            "id": post.get('id'),
-            "title": post.get('title'),
-            "selftext": post.get('selftext', ''),
-            "analysis": analysis,
-            "subreddit": post.get('subreddit'),
-            "url": post.get('url'),
-            "score": post.get('score'),
-            "embedding": embedding,
-            "created_at": created_at
-        }
+        print_debug(f"Storing: {post.get('title')[:50]}...")
         
         # Use upsert to handle both insert and update
-        result = supabase.table("reddit_posts").upsert(data).execute()
+        result = await asyncio.to_thread(
+            supabase.table("reddit_posts").upsert(
+                _post_row(post, embedding, analysis),
+                on_conflict="id",
+                ignore_duplicates=ignore_duplicates
+            ).execute
+        )
         
         if result.data:
-            print_success("✓")
+            flat_index.add([post], [embedding])
+            print_debug("✓")
             return True
         else:
             print_error("✗")
@@ -38,36 +88,152 @@ async def store_post_with_embedding(post: dict, embedding: List[float], analysis
         print_error(f"Error: {str(e)}")
         return False
 
+async def store_posts_batch(
+    posts: List[dict],
+    embeddings: List[List[float]],
+    analyses: Optional[List[str]] = None,
+    ignore_duplicates: bool = False
+) -> int:
+    """Store many posts with their embeddings through one COPY and upsert. Returns the number stored.
+
+    With ignore_duplicates, rows that already exist are left untouched instead of overwritten.
+    """
+    if not posts:
+        return 0
+    analyses = analyses or [None] * len(posts)
+    try:
+        # Key by id: one statement can't upsert the same row twice
+        records = {
+            post['id']: _post_record(post, embedding, analysis)
+            for post, embedding, analysis in zip(posts, embeddings, analyses)
+        }
+        columns = ", ".join(_COPY_COLUMNS)
+        staged = ", ".join("embedding::vector" if column == "embedding" else column for column in _COPY_COLUMNS)
+        if ignore_duplicates:
+            on_conflict = "DO NOTHING"
+        else:
+            on_conflict = "DO UPDATE SET " + ", ".join(
+                f"{column} = EXCLUDED.{column}" for column in _COPY_COLUMNS if column != "id"
+            )
+        # COPY into a staging table, then upsert from it in one statement; COPY itself can't upsert
+        async with db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    """CREATE TEMP TABLE posts_staging (
+                        id text, title text, selftext text, analysis text, subreddit text, url text,
+                        score integer, embedding text, embedding_i8 bytea, embedding_scale float4,
+                        created_at timestamptz
+                    ) ON COMMIT DROP"""
+                )
+                await conn.copy_records_to_table(
+                    "posts_staging", records=list(records.values()), columns=_COPY_COLUMNS
+                )
+                status = await conn.execute(
+                    f"""INSERT INTO reddit_posts ({columns})
+                    SELECT {staged} FROM posts_staging
+                    ON CONFLICT (id) {on_conflict}"""
+                )
+        stored = int(status.split()[-1])  # Status is "INSERT 0 <count>"
+        if stored:
+            flat_index.add(posts, embeddings)
+        print_success(f"Stored {stored}/{len(records)} posts")
+        return stored
+    except Exception as e:
+        # One bad row rejects the whole statement; store row by row so the rest still land
+        print_error(f"Error storing posts batch, retrying per post: {str(e)}")
+        results = await asyncio.gather(*[
+            store_post_with_embedding(post, embedding, analysis, ignore_duplicates)
+            for post, embedding, analysis in zip(posts, embeddings, analyses)
+        ])
+        return sum(results)
+
 async def update_post_analysis(post_id: str, analysis: str) -> bool:
     """Update the analysis of an existing post."""
     try:
-        result = supabase.table("reddit_posts").update({"analysis": analysis}).eq("id", post_id).execute()
+        result = await asyncio.to_thread(
+            supabase.table("reddit_posts").update({"analysis": analysis}).eq("id", post_id).execute
+        )
         if result.data:
-            print_success(f"Updated analysis for post {post_id}")
+            print_debug(f"Updated analysis for post {post_id}")
             return True
         return False
     except Exception as e:
         print_error(f"Error updating analysis: {e}")
         return False
 
-async def get_analyzed_posts(subreddit: str, since_time: datetime) -> List[Dict]:
-    """Get already analyzed posts from database."""
+async def bulk_update_analyses(rows: List[Tuple[str, str]]) -> int:
+    """Set the analysis of many posts in one statement. Returns the number of posts updated."""
+    if not rows:
+        return 0
+    try:
+        post_ids, analyses = zip(*rows)
+        status = await db.execute(
+            """UPDATE reddit_posts SET analysis = v.analysis
+            FROM unnest($1::text[], $2::text[]) AS v(id, analysis)
+            WHERE reddit_posts.id = v.id""",
+            list(post_ids), list(analyses)
+        )
+        return int(status.split()[-1])  # Status is "UPDATE <count>"
+    except Exception as e:
+        print_error(f"Error updating analyses: {e}")
+        return 0
+
+async def get_existing_analyses(
+    post_ids: List[str],
+    skip_unindexed: bool = False
+) -> Optional[Dict[str, Optional[str]]]:
+    """Return {post_id: analysis} for the given ids that are already stored, or None on error.
+
+    With skip_unindexed, ids the in-memory index doesn't hold are treated as new without a query.
+    The index only knows posts with an embedding that were stored by this process or present at
+    startup, so only use it where misclassifying a stored post as new is harmless.
+    """
+    if skip_unindexed and flat_index.enabled:
+        post_ids = [post_id for post_id in post_ids if post_id in flat_index.positions]
+        if not post_ids:
+            return {}
+    try:
+        rows = await db.fetch(
+            "SELECT id, analysis FROM reddit_posts WHERE id = ANY($1::text[])",
+            post_ids
+        )
+        return {row['id']: row['analysis'] for row in rows}
+    except Exception as e:
+        print_error(f"Error checking existing posts: {e}")
+        return None
+
+async def get_unanalyzed_posts(subreddit: str, limit: int) -> List[Dict]:
+    """Get the highest scoring stored posts of a subreddit that have no analysis yet."""
+    try:
+        return await db.fetch(
+            """SELECT id, title, selftext FROM reddit_posts
+            WHERE subreddit ILIKE $1 AND analysis IS NULL
+            ORDER BY score DESC LIMIT $2""",
+            subreddit, limit
+        )
+    except Exception as e:
+        print_error(f"Error fetching unanalyzed posts: {e}")
+        return []
+
+async def get_analyzed_posts(subreddit: str, since_time: datetime, min_score: int = 0) -> List[Dict]:
+    """Get already analyzed problem posts scoring at least min_score from database."""
     try:
         print_step(f"Querying posts for r/{subreddit} since {since_time.isoformat()}")
-        result = supabase.table("reddit_posts")\
-            .select("*")\
-            .filter('subreddit', 'ilike', subreddit)\
-            .gte("created_at", since_time.isoformat())\
-            .not_.is_("analysis", "null")\
-            .order("score", desc=True)\
-            .execute()
+        posts = await db.fetch(
+            f"""SELECT {POST_COLUMNS} FROM reddit_posts
+            WHERE subreddit ILIKE $1 AND created_at >= $2 AND score >= $3
+            AND analysis IS NOT NULL
+            AND (problem_keyword_hits IS NULL OR cardinality(problem_keyword_hits) > 0)
+            ORDER BY score DESC""",
+            subreddit, since_time, min_score
+        )
         
-        if not result.data:
+        if not posts:
             print_step(f"No analyzed posts found for r/{subreddit}")
             return []
         
-        print_success(f"Retrieved {len(result.data)} posts from database")
-        return result.data
+        print_success(f"Retrieved {len(posts)} posts from database")
+        return posts
     except Exception as e:
         print_error(f"Error getting analyzed posts: {e}")
         return []
@@ -75,17 +241,12 @@ async def get_analyzed_posts(subreddit: str, since_time: datetime) -> List[Dict]
 async def get_last_search(subreddit: str, timeframe: str) -> Optional[Dict]:
     """Get the last search results for this subreddit and timeframe."""
     try:
-        result = supabase.table("search_history")\
-            .select("*")\
-            .filter('subreddit', 'ilike', subreddit)\
-            .eq("timeframe", timeframe)\
-            .order("last_search_time", desc=True)\
-            .limit(1)\
-            .execute()
-        
-        if result.data and len(result.data) > 0:
-            return result.data[0]
-        return None
+        return await db.fetchrow(
+            """SELECT last_search_time FROM search_history
+            WHERE subreddit ILIKE $1 AND timeframe = $2
+            ORDER BY last_search_time DESC LIMIT 1""",
+            subreddit, timeframe
+        )
     except Exception as e:
         print_error(f"Error getting last search: {e}")
         return None
@@ -93,46 +254,19 @@ async def get_last_search(subreddit: str, timeframe: str) -> Optional[Dict]:
 async def update_search_history(subreddit: str, timeframe: str, last_post_time: datetime) -> bool:
     """Update search history with new timestamp."""
     try:
-        now = datetime.now(timezone.utc)
-        
-        # First try to get existing record
-        existing = supabase.table("search_history")\
-            .select("*")\
-            .filter('subreddit', 'ilike', subreddit)\
-            .eq("timeframe", timeframe)\
-            .execute()
-        
-        # Format timestamps in PostgreSQL compatible ISO 8601 format
-        # Format: YYYY-MM-DD"T"HH24:MI:SS.MSOF
-        def format_timestamp(dt: datetime) -> str:
-            # Ensure UTC timezone
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            # Format with 6 digits for microseconds and explicit +00:00 timezone
-            return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + '+00:00'
-
-        # Normalize subreddit case to be consistent
-        normalized_subreddit = subreddit.lower()
-        
-        data = {
-            "subreddit": normalized_subreddit,
-            "timeframe": timeframe,
-            "last_search_time": format_timestamp(now),
-            "last_post_time": format_timestamp(last_post_time)
-        }
+        # Ensure UTC timezone
+        if last_post_time.tzinfo is None:
+            last_post_time = last_post_time.replace(tzinfo=timezone.utc)
         
-        if existing.data and len(existing.data) > 0:
-            # Update existing record
-            result = supabase.table("search_history")\
-                .update(data)\
-                .eq("subreddit", normalized_subreddit)\
-                .eq("timeframe", timeframe)\
-                .execute()
-        else:
-            # Insert new record
-            result = supabase.table("search_history")\
-                .insert(data)\
-                .execute()
+        # Single atomic upsert; subreddit case is normalized to match the unique key
+        await db.execute(
+            """INSERT INTO search_history (subreddit, timeframe, last_search_time, last_post_time)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (subreddit, timeframe) DO UPDATE
+            SET last_search_time = EXCLUDED.last_search_time,
+                last_post_time = EXCLUDED.last_post_time""",
+            subreddit.lower(), timeframe, datetime.now(timezone.utc), last_post_time
+        )
         
         print_success(f"Updated search history for r/{subreddit}")
         return True
@@ -142,45 +276,159 @@ async def update_search_history(subreddit: str, timeframe: str, last_post_time:
 
 async def semantic_search_with_offset(
     query: str,
-    subreddit: str,
+    subreddit: Optional[str],
     match_threshold: float = 0.7,
     limit: int = 10,
-    seen_ids: set = None
+    cursor: Optional[Tuple[float, str]] = None,
+    ef_search: int = DEFAULT_EF_SEARCH,
+    query_embedding: Optional[List[float]] = None
 ) -> List[Dict]:
-    """Enhanced semantic search that can skip already seen posts."""
-    from .openai_service import generate_embedding  # Import here to avoid circular dependency
+    """Semantic search that resumes after a (similarity, id) cursor.
+    
+    To fetch the next page, pass the similarity and id of the last returned post.
+    Pass query_embedding when the query is already embedded to skip embedding it again.
+    """
+    from .openai_service import get_query_embedding  # Import here to avoid circular dependency
     
     try:
-        query_embedding = await generate_embedding(query)
+        if query_embedding is None:
+            query_embedding = await get_query_embedding(query)
         if not query_embedding:
             return []
 
-        # Get more results than needed to account for filtering
-        results = supabase.rpc(
-            'match_posts',
-            {
-                'query_embedding': query_embedding,
-                'match_threshold': match_threshold,
-                'match_count': limit * 3  # Get extra to allow for filtering
-            }
-        ).execute()
-
-        if not results.data:
-            return []
-
-        # Filter by subreddit and unseen posts
-        filtered_results = []
-        seen_ids = seen_ids or set()
+        cursor_similarity, cursor_id = cursor if cursor else (None, None)
+        
+        # Pre-rank in memory on the int8 index, then score only those candidates in the
+        # database, the same way match_posts does, instead of searching the whole table
+        if flat_index.enabled:
+            candidates = flat_index.search(
+                query_embedding,
+                match_threshold - FLAT_PREFILTER_MARGIN,
+                limit * 2,
+                subreddit,
+                (cursor_similarity + FLAT_PREFILTER_MARGIN, cursor_id) if cursor else None
+            )
+            if not candidates:
+                return []
+            return await db.fetch(
+                """SELECT * FROM (
+                    SELECT id, title, selftext, analysis, subreddit, url, score,
+                        1 - (embedding_half <=> $1::halfvec(1536)) AS similarity
+                    FROM reddit_posts WHERE id = ANY($2::text[])
+                ) candidates
+                WHERE similarity > $3
+                AND ($4::float IS NULL OR (similarity, id) < ($4::float, $5::text))
+                ORDER BY similarity DESC, id DESC
+                LIMIT $6""",
+                db.vector_literal(query_embedding), [post_id for post_id, _ in candidates],
+                match_threshold, cursor_similarity, cursor_id, limit
+            )
         
-        for post in results.data:
-            if post['subreddit'].lower() == subreddit.lower() and post['id'] not in seen_ids:
-                filtered_results.append(post)
-                if len(filtered_results) >= limit:
-                    break
-
-        filtered_results.sort(key=lambda x: x.get('similarity', 0), reverse=True)
-        return filtered_results[:limit]
+        # match_posts over-fetches through the HNSW index and applies the subreddit filter
+        # Rows come back ordered by similarity; don't reorder them
+        return await db.fetch(
+            "SELECT * FROM match_posts($1::vector, $2, $3, $4, $5, $6, $7)",
+            db.vector_literal(query_embedding), match_threshold, limit,
+            subreddit, ef_search, cursor_similarity, cursor_id
+        )
             
     except Exception as e:
         print_error(f"Error: {str(e)}")
-        return [] 
\ No newline at end of file
+        return []
+
+async def get_posts_by_ids(post_ids: List[str], query_embedding: Optional[List[float]] = None) -> List[Dict]:
+    """Get stored posts by id, preserving the order of post_ids.
+
+    With query_embedding, each post also gets its similarity to the query, as search results have.
+    """
+    try:
+        if query_embedding:
+            posts = await db.fetch(
+                f"""SELECT {POST_COLUMNS}, 1 - (embedding_half <=> $2::halfvec(1536)) AS similarity
+                FROM reddit_posts WHERE id = ANY($1::text[])""",
+                post_ids, db.vector_literal(query_embedding)
+            )
+        else:
+            posts = await db.fetch(
+                f"SELECT {POST_COLUMNS} FROM reddit_posts WHERE id = ANY($1::text[])",
+                post_ids
+            )
+        posts_by_id = {post['id']: post for post in posts}
+        return [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    except Exception as e:
+        print_error(f"Error getting posts by id: {e}")
+        return []
+
+async def get_semantic_cache_hit(
+    query_embedding: List[float],
+    subreddit: Optional[str],
+    match_threshold: float,
+    limit: int
+) -> Optional[List[str]]:
+    """Return the post ids cached for a near-identical earlier query, if any."""
+    try:
+        hit = await db.fetchrow(
+            "SELECT result_post_ids FROM match_semantic_cache($1::vector, $2, $3, $4, $5, $6)",
+            db.vector_literal(query_embedding),
+            subreddit.lower() if subreddit else None,
+            match_threshold,
+            limit,
+            SEMANTIC_CACHE_THRESHOLD,
+            timedelta(days=SEMANTIC_CACHE_TTL_DAYS)
+        )
+        if hit:
+            return hit['result_post_ids'][:limit]
+        return None
+    except Exception as e:
+        print_error(f"Error checking semantic cache: {e}")
+        return None
+
+async def store_semantic_cache(
+    query_embedding: List[float],
+    subreddit: Optional[str],
+    match_threshold: float,
+    limit: int,
+    post_ids: List[str]
+) -> bool:
+    """Cache the post ids returned for a query."""
+    try:
+        await asyncio.to_thread(supabase.table("semantic_cache").insert({
+            "query_embedding": query_embedding,
+            "subreddit": subreddit.lower() if subreddit else None,
+            "result_post_ids": post_ids,
+            "similarity_threshold": match_threshold,
+            "match_count": limit
+        }).execute)
+        return True
+    except Exception as e:
+        print_error(f"Error storing semantic cache entry: {e}")
+        return False
+
+async def get_cached_analysis(content_hash: str, model: str) -> Optional[str]:
+    """Get a previously stored analysis for the given content hash and model."""
+    try:
+        row = await db.fetchrow(
+            "SELECT analysis FROM post_analysis_cache WHERE content_hash = $1 AND model = $2",
+            content_hash, model
+        )
+        return row['analysis'] if row else None
+    except Exception as e:
+        print_error(f"Error getting cached analysis: {e}")
+        return None
+
+async def store_cached_analysis(content_hash: str, model: str, analysis: str) -> bool:
+    """Store an analysis under its content hash, keeping any existing entry."""
+    try:
+        await asyncio.to_thread(
+            supabase.table("post_analysis_cache")
+            .upsert(
+                {"content_hash": content_hash, "model": model, "analysis": analysis},
+                on_conflict="content_hash,model",
+                ignore_duplicates=True
+            )
+            .execute
+        )
+        return True
+    except Exception as e:
+        print_error(f"Error storing cached analysis: {e}")
+        return False
@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 # Problem-related keywords for Reddit search
 PROBLEM_KEYWORDS = [
     "need tool for", "need software for", "looking for tool", "looking for app",
@@ -21,8 +23,72 @@ TIMEFRAMES = {
     'month': 30,
     'year': 365
 }
+TIMEFRAME_DELTAS = {name: timedelta(days=days) for name, days in TIMEFRAMES.items()}
 
 # API configuration
 DEFAULT_LIMIT = 10
 MAX_LIMIT = 100
-DEFAULT_SIMILARITY_THRESHOLD = 0.7 
\ No newline at end of file
+DEFAULT_SIMILARITY_THRESHOLD = 0.7
+# Larger model used for free-text analyses at least ANALYSIS_ESCALATION_CHARS long
+ANALYSIS_MODEL_LARGE = "gpt-4o-2024-08-06"
+ANALYSIS_ESCALATION_CHARS = 2000
+# Stored post vectors and query vectors must come from the same model;
+# changing it requires re-embedding reddit_posts
+EMBEDDING_MODEL = "text-embedding-ada-002"
+DEFAULT_EF_SEARCH = 80  # HNSW candidate list size for vector search
+
+# Maximum total characters of comment text fetched per post
+MAX_COMMENT_CHARS = 8000
+
+# Maximum number of embeddings kept in the in-process LRU cache
+EMBEDDING_CACHE_SIZE = 4096
+
+# Maximum number of analyses kept in the in-process analysis cache
+ANALYSIS_CACHE_SIZE = 1024
+
+# Semantic query cache: minimum query similarity for a hit, and entry lifetime
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL_DAYS = 7
+
+# Maximum number of concurrent LLM analysis calls
+ANALYSIS_CONCURRENCY = 8
+
+# Seconds a finished /api/analyze-problems task is reused for identical requests
+ANALYZE_PROBLEMS_TTL_SECONDS = 60
+
+# Maximum number of subreddits processed at once
+SUBREDDIT_CONCURRENCY = 5
+
+# Maximum number of open connections to Reddit
+REDDIT_CONNECTION_LIMIT = 20
+
+# Seconds a subreddit validation result is reused
+SUBREDDIT_VALIDATION_TTL_SECONDS = 24 * 60 * 60
+
+# Maximum number of subreddit validation results kept in memory
+SUBREDDIT_VALIDATION_CACHE_SIZE = 1024
+
+# Maximum number of embedding batch requests in flight at once
+EMBEDDING_CONCURRENCY = 8
+
+# In-process semantic cache of pipeline results: max entries and freshness window
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_TTL_SECONDS = 600
+
+# Dimensions of the stored post embeddings
+EMBEDDING_DIMENSIONS = 1536
+
+# Largest reddit_posts table pre-ranked in memory instead of through the match_posts RPC
+# (the int8 index takes ~1.5 KB per row)
+FLAT_SEARCH_MAX_ROWS = 200000
+# Similarity slack for the int8 pre-ranking, so candidates near the threshold are still rescored exactly
+FLAT_PREFILTER_MARGIN = 0.01
+
+# OpenAI chat budgets per minute; requests wait instead of running into 429s
+OPENAI_RPM_LIMIT = 500
+OPENAI_TPM_LIMIT = 200000
+
+# Completion budget per analyzed post, around the 95th percentile of analysis length
+ANALYSIS_MAX_TOKENS = 350
+# Input token budget for one multi-post analysis request
+ANALYSIS_BATCH_INPUT_TOKENS = 6000
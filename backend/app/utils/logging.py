@@ -1,38 +1,79 @@
+import os
+import sys
+import logging
+from contextlib import contextmanager
+from tqdm import tqdm
 from colorama import init, Fore, Style
 
-# Initialize colorama
-init()
+# Colorama only needs to wrap the output streams when colors are actually written
+if sys.stdout.isatty() or sys.stderr.isatty():
+    init()
 
-def print_banner():
-    """Print a welcome banner for the application."""
-    banner = f"""
-{Fore.CYAN}╔══════════════════════════════════════════════════════════╗
+logger = logging.getLogger("guliver")
+
+class ColorFormatter(logging.Formatter):
+    """Format records with a status marker, colored only when writing to a terminal."""
+
+    STYLES = {
+        'step': (Fore.BLUE, '➜'),
+        'success': (Fore.GREEN, '✓'),
+        'error': (Fore.RED, '✗'),
+    }
+
+    def __init__(self, use_color: bool):
+        super().__init__()
+        # Build each kind's prefix and suffix once instead of per record
+        reset = Style.RESET_ALL if use_color else ""
+        self.affixes = {
+            kind: (f"{color if use_color else ''}{marker} ", reset)
+            for kind, (color, marker) in self.STYLES.items()
+        }
+
+    def format(self, record):
+        prefix, suffix = self.affixes.get(getattr(record, 'kind', 'step'), self.affixes['step'])
+        return f"{prefix}{record.getMessage()}{suffix}"
+
+def _configure_logger():
+    """Attach a stderr handler to the Guliver logger, honouring LOG_LEVEL."""
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(ColorFormatter(use_color=sys.stderr.isatty()))
+    logger.addHandler(handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+_configure_logger()
+
+_BANNER = """
+╔══════════════════════════════════════════════════════════╗
 ║                Reddit Market Research Tool                  ║
 ║           Search, Analyze, and Extract Insights            ║
-╚══════════════════════════════════════════════════════════╝{Style.RESET_ALL}
+╚══════════════════════════════════════════════════════════╝
 """
-    print(banner)
+if sys.stdout.isatty():
+    _BANNER = f"{Fore.CYAN}{_BANNER}{Style.RESET_ALL}"
+
+def print_banner():
+    """Print a welcome banner for the application."""
+    print(_BANNER)
+
+def print_debug(message):
+    """Log a verbose step that is hidden at the default INFO level."""
+    logger.debug(message, extra={'kind': 'step'})
 
 def print_step(message):
-    """Print a step with formatting."""
-    print(f"\n{Fore.BLUE}➜ {message}{Style.RESET_ALL}")
+    """Log a step with formatting."""
+    logger.info(message, extra={'kind': 'step'})
 
 def print_success(message):
-    """Print a success message with formatting."""
-    print(f"{Fore.GREEN}✓ {message}{Style.RESET_ALL}")
+    """Log a success message with formatting."""
+    logger.info(message, extra={'kind': 'success'})
 
 def print_error(message):
-    """Print an error message with formatting."""
-    print(f"{Fore.RED}✗ {message}{Style.RESET_ALL}")
-
-def loading_spinner(message):
-    """Display a loading spinner with a message."""
-    import sys
-    import time
-    spinner = ['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏']
-    i = 0
-    while True:
-        sys.stdout.write(f'\r{Fore.YELLOW}{spinner[i]}{Style.RESET_ALL} {message}')
-        sys.stdout.flush()
-        time.sleep(0.1)
-        i = (i + 1) % len(spinner) 
\ No newline at end of file
+    """Log an error message with formatting."""
+    logger.error(message, extra={'kind': 'error'})
+
+@contextmanager
+def progress(total: int, description: str):
+    """Show a progress bar on an interactive terminal; advance it with bar.update(1) as work completes."""
+    with tqdm(total=total, desc=description, disable=not sys.stderr.isatty(), leave=False) as bar:
+        yield bar
@@ -0,0 +1,33 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+class RateLimiter:
+    """Sliding one-minute window over a requests-per-minute and a tokens-per-minute budget."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._calls: Deque[Tuple[float, int]] = deque()
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+
+    def _expire(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] >= 60:
+            _, tokens = self._calls.popleft()
+            self._tokens -= tokens
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until a request using tokens fits in both budgets, then record it."""
+        tokens = min(tokens, self.tpm)  # A single oversized request must still be able to go
+        # Waiters queue on the lock, so they are admitted in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                if len(self._calls) < self.rpm and self._tokens + tokens <= self.tpm:
+                    self._calls.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                await asyncio.sleep(60 - (now - self._calls[0][0]))
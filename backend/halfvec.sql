@@ -0,0 +1,10 @@
+-- Half-precision (FP16) copy of each embedding, kept in sync with the embedding column
+alter table reddit_posts
+    add column if not exists embedding_half halfvec(1536)
+    generated always as (embedding::halfvec(1536)) stored;
+
+-- Search the half-precision copy through HNSW; it is half the size of the FP32 index
+create index if not exists reddit_posts_embedding_half_idx on reddit_posts using hnsw (embedding_half halfvec_cosine_ops) with (m = 16, ef_construction = 64);
+
+-- Drop any FP32 embedding index left by earlier migrations; match_posts doesn't use it
+drop index if exists reddit_posts_embedding_idx;
@@ -0,0 +1,3 @@
+-- Replace the IVFFlat embedding index; the HNSW index that replaces it is built on
+-- the half-precision copy of the embeddings in halfvec.sql, so run that next
+drop index if exists reddit_posts_embedding_idx;
@@ -0,0 +1,5 @@
+-- int8 copy of each post embedding (unit-normalized, row ~= embedding_i8 * embedding_scale).
+-- The in-memory search loads these instead of the float column: 1.5 KB per row instead of 6 KB.
+-- Written by the backend on upsert; rows without it are quantized when the index is loaded.
+alter table reddit_posts add column if not exists embedding_i8 bytea;
+alter table reddit_posts add column if not exists embedding_scale float4;
@@ -0,0 +1,8 @@
+-- Cache of LLM analyses keyed by a hash of the analyzed post and comments text
+create table if not exists post_analysis_cache (
+    content_hash text not null,
+    model text not null,
+    analysis text not null,
+    created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    primary key (content_hash, model)
+);
@@ -0,0 +1,96 @@
+-- Problem keywords each post matches, computed once at write time so problem-post
+-- lookups filter with an index instead of scanning text in Python.
+-- Keep the keyword list in sync with PROBLEM_KEYWORDS in app/utils/constants.py.
+-- NULL means not computed yet; get_analyzed_posts keeps such rows, as it did before the column existed.
+alter table reddit_posts add column if not exists problem_keyword_hits text[];
+alter table reddit_posts alter column problem_keyword_hits drop not null;
+alter table reddit_posts alter column problem_keyword_hits drop default;
+
+create or replace function set_problem_keyword_hits()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.problem_keyword_hits := array(
+        select keyword
+        from unnest(array[
+        'need tool for',
+        'need software for',
+        'looking for tool',
+        'looking for app',
+        'recommend tool',
+        'recommend software',
+        'any tools for',
+        'any apps for',
+        'frustrated with',
+        'tired of manually',
+        'hate doing',
+        'waste time',
+        'wasting time',
+        'takes forever to',
+        'pain point',
+        'pain in the',
+        'annoying process',
+        'automate this',
+        'efficiency',
+        'productivity',
+        'automation',
+        'workflow',
+        'business needs',
+        'company requires',
+        'enterprise solution',
+        'scale our',
+        'manage multiple',
+        'track all',
+        'monitor our',
+        'integrate with',
+        'data entry',
+        'manual process',
+        'repetitive tasks',
+        'time consuming',
+        'complex workflow',
+        'communication gap',
+        'coordination',
+        'collaboration',
+        'solution for',
+        'struggle with',
+        'difficult to',
+        'can''t figure out',
+        'need to improve',
+        'optimize',
+        'streamline',
+        'simplify',
+        'how to solve',
+        'help managing',
+        'better way to',
+        'alternative to'
+        ]) as keyword
+        where lower(coalesce(new.title, '') || ' ' || coalesce(new.selftext, '')) like '%' || keyword || '%'
+    );
+    return new;
+end;
+$$;
+
+drop trigger if exists reddit_posts_problem_keyword_hits on reddit_posts;
+create trigger reddit_posts_problem_keyword_hits
+    before insert or update of title, selftext on reddit_posts
+    for each row execute function set_problem_keyword_hits();
+
+-- Backfill existing rows through the trigger, then check nothing was missed
+update reddit_posts set title = title where problem_keyword_hits is null;
+
+do $$
+begin
+    if exists (select 1 from reddit_posts where problem_keyword_hits is null) then
+        raise exception 'problem_keyword_hits backfill is incomplete';
+    end if;
+end $$;
+
+create index if not exists reddit_posts_problem_keyword_hits_idx
+    on reddit_posts using gin (problem_keyword_hits);
+
+-- Serves the analyzed problem-post lookup: subreddit + time range, best scores first
+drop index if exists reddit_posts_problem_posts_idx;
+create index reddit_posts_problem_posts_idx
+    on reddit_posts (subreddit, created_at, score desc)
+    where analysis is not null and (problem_keyword_hits is null or cardinality(problem_keyword_hits) > 0);
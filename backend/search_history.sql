@@ -0,0 +1,33 @@
+-- Create a table for tracking when each subreddit/timeframe was last searched
+create table if not exists search_history (
+    id uuid default gen_random_uuid() primary key,
+    subreddit text not null,
+    timeframe text not null,
+    last_search_time timestamp with time zone not null,
+    last_post_time timestamp with time zone not null
+);
+
+-- Store timestamps as timestamptz on existing tables as well (Supabase sessions run in UTC)
+alter table search_history
+    alter column last_search_time type timestamp with time zone using last_search_time::timestamptz,
+    alter column last_post_time type timestamp with time zone using last_post_time::timestamptz;
+
+-- Normalize subreddit names and keep only the latest row per subreddit/timeframe
+update search_history set subreddit = lower(subreddit);
+
+delete from search_history a
+using search_history b
+where a.subreddit = b.subreddit
+    and a.timeframe = b.timeframe
+    and (a.last_search_time, a.id) < (b.last_search_time, b.id);
+
+-- One row per subreddit/timeframe, so updates can be a single upsert
+do $$
+begin
+    if not exists (
+        select 1 from pg_constraint
+        where conname = 'search_history_sr_tf_uniq' and conrelid = 'search_history'::regclass
+    ) then
+        alter table search_history add constraint search_history_sr_tf_uniq unique (subreddit, timeframe);
+    end if;
+end $$;
@@ -0,0 +1,58 @@
+-- Cache of previous search queries and the posts they returned
+create table if not exists semantic_cache (
+    id uuid default gen_random_uuid() primary key,
+    query_embedding vector(1536) not null,
+    subreddit text,
+    result_post_ids text[] not null,
+    similarity_threshold float not null,
+    match_count int not null,
+    created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+-- Create an HNSW index for near-duplicate query lookups
+create index if not exists semantic_cache_query_embedding_idx on semantic_cache using hnsw (query_embedding vector_cosine_ops);
+
+-- Create an index on created_at for expiring old entries
+create index if not exists idx_semantic_cache_created_at on semantic_cache(created_at);
+
+-- Function to find a cached result for a near-identical query
+create or replace function match_semantic_cache(
+    query_embedding vector(1536),
+    subreddit_filter text,
+    similarity_threshold float,
+    match_count int,
+    min_similarity float default 0.95,
+    max_age interval default interval '7 days'
+)
+returns table (
+    result_post_ids text[],
+    similarity float
+)
+language plpgsql
+as $$
+begin
+    return query
+    select
+        semantic_cache.result_post_ids,
+        1 - (semantic_cache.query_embedding <=> match_semantic_cache.query_embedding) as similarity
+    from semantic_cache
+    where
+        semantic_cache.subreddit is not distinct from subreddit_filter
+        and semantic_cache.similarity_threshold = match_semantic_cache.similarity_threshold
+        and semantic_cache.match_count >= match_semantic_cache.match_count
+        and semantic_cache.created_at > now() - max_age
+        and 1 - (semantic_cache.query_embedding <=> match_semantic_cache.query_embedding) > min_similarity
+    order by semantic_cache.query_embedding <=> match_semantic_cache.query_embedding
+    limit 1;
+end;
+$$;
+
+-- Delete expired entries every night (requires the pg_cron extension);
+-- keep the interval in sync with SEMANTIC_CACHE_TTL_DAYS in app/utils/constants.py
+create extension if not exists pg_cron;
+
+select cron.schedule(
+    'expire-semantic-cache',
+    '0 3 * * *',
+    $$delete from semantic_cache where created_at < now() - interval '7 days'$$
+);
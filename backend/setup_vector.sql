@@ -13,14 +13,15 @@ create table if not exists reddit_posts (
     subreddit text,
     url text,
     score integer,
-    embedding vector(1536)  -- Add embedding column for similarity search
+    embedding vector(1536),  -- Add embedding column for similarity search
+    embedding_half halfvec(1536) generated always as (embedding::halfvec(1536)) stored  -- FP16 copy used by vector search
 );
 
 -- Create an index on created_at for better query performance
 create index if not exists idx_reddit_posts_created_at on reddit_posts(created_at);
 
--- Create an index on the embedding column for faster similarity search
-create index if not exists reddit_posts_embedding_idx on reddit_posts using ivfflat (embedding vector_cosine_ops);
+-- Create an index on the half-precision embedding column for faster similarity search
+create index if not exists reddit_posts_embedding_half_idx on reddit_posts using hnsw (embedding_half halfvec_cosine_ops) with (m = 16, ef_construction = 64);
 
 -- Enable Row Level Security (RLS)
 alter table reddit_posts enable row level security;
@@ -0,0 +1,19 @@
+-- Per-subreddit post counts, so the stats endpoint doesn't scan reddit_posts on every call
+create materialized view if not exists subreddit_stats as
+select
+    subreddit,
+    count(*) as total_posts
+from reddit_posts
+group by subreddit;
+
+-- A unique index is required for refresh ... concurrently
+create unique index if not exists subreddit_stats_subreddit_idx on subreddit_stats(subreddit);
+
+-- Refresh every 5 minutes (requires the pg_cron extension)
+create extension if not exists pg_cron;
+
+select cron.schedule(
+    'refresh-subreddit-stats',
+    '*/5 * * * *',
+    'refresh materialized view concurrently subreddit_stats'
+);
@@ -1,9 +1,18 @@
+-- Drop previous signatures so the new arguments don't create overloads
+drop function if exists match_posts(vector, float, int, text);
+drop function if exists match_posts(vector, float, int, text, int);
+
 -- Function to match posts based on embedding similarity
+-- Pages are fetched with a keyset cursor: pass the similarity and id of the
+-- last row of the previous page to get the rows that rank after it
 create or replace function match_posts(
     query_embedding vector(1536),
     match_threshold float,
     match_count int,
-    subreddit_filter text default null
+    subreddit_filter text default null,
+    ef_search int default 80,
+    cursor_similarity float default null,
+    cursor_id text default null
 )
 returns table (
     id text,
@@ -17,24 +26,50 @@ returns table (
 )
 language plpgsql
 as $$
+declare
+    -- Search the FP16 copy of the embeddings, which halves the bytes read per row
+    query_half halfvec(1536) := query_embedding::halfvec(1536);
 begin
+    -- Size of the HNSW candidate list; higher trades latency for recall
+    perform set_config('hnsw.ef_search', greatest(ef_search, match_count * 3)::text, true);
+    -- Keep scanning the index when the cursor filters out the first candidates;
+    -- the setting only exists from pgvector 0.8, and setting it earlier is an error
+    if (
+        select string_to_array(extversion, '.')::int[] >= array[0, 8]
+        from pg_extension where extname = 'vector'
+    ) then
+        perform set_config('hnsw.iterative_scan', 'strict_order', true);
+    end if;
+
     return query
-    select
-        reddit_posts.id,
-        reddit_posts.title,
-        reddit_posts.selftext,
-        reddit_posts.analysis,
-        reddit_posts.subreddit,
-        reddit_posts.url,
-        reddit_posts.score,
-        1 - (reddit_posts.embedding <=> query_embedding) as similarity
-    from reddit_posts
+    select candidates.*
+    from (
+        -- Over-fetch nearest neighbours through the HNSW index, then filter,
+        -- since the index cannot apply the subreddit filter itself
+        select
+            reddit_posts.id,
+            reddit_posts.title,
+            reddit_posts.selftext,
+            reddit_posts.analysis,
+            reddit_posts.subreddit,
+            reddit_posts.url,
+            reddit_posts.score,
+            1 - (reddit_posts.embedding_half <=> query_half) as similarity
+        from reddit_posts
+        where
+            -- Skip everything up to and including the cursor row
+            cursor_similarity is null
+            or (1 - (reddit_posts.embedding_half <=> query_half), reddit_posts.id) < (cursor_similarity, cursor_id)
+        order by reddit_posts.embedding_half <=> query_half
+        limit match_count * 3
+    ) candidates
     where
         -- Apply subreddit filter only if provided
-        (subreddit_filter is null or reddit_posts.subreddit = subreddit_filter)
+        (subreddit_filter is null or lower(candidates.subreddit) = lower(subreddit_filter))
         -- Only return posts that are more similar than the threshold
-        and 1 - (reddit_posts.embedding <=> query_embedding) > match_threshold
-    order by reddit_posts.embedding <=> query_embedding
+        and candidates.similarity > match_threshold
+    -- Callers rely on this order and do not re-sort the results
+    order by candidates.similarity desc, candidates.id desc
     limit match_count;
 end;
-$$; 
\ No newline at end of file
+$$;